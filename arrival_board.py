@@ -0,0 +1,99 @@
+import time
+import bisect
+import typing
+from bart_data import FeedSnapshot
+from station_search import station_index
+
+class _StationArrivals:
+    """
+    One station's row range [lo, hi) of the snapshot's ArrivalTable, sorted by absolute epoch time.
+    Rows before `start` arrived before `until`, the latest clock reading seen; queries at or
+    after `until` skip them, earlier ones search the whole range.
+    """
+    __slots__ = ('lo', 'hi', 'start', 'until')
+
+    def __init__(self, lo: int, hi: int):
+        self.lo = lo
+        self.hi = hi
+        self.start = lo
+        self.until = float('-inf')
+
+    def evict(self, times: typing.Sequence[int], now: float) -> None:
+        # only ever moves forward, even if the wall clock steps back
+        if now > self.until:
+            self.start = bisect.bisect_left(times, now, self.start, self.hi)
+            self.until = now
+
+    def first(self, times: typing.Sequence[int], after: float) -> int:
+        """
+        Index of the first row at or after `after`; never moves the cursor.
+        """
+        lo = self.start if after >= self.until else self.lo
+        return bisect.bisect_left(times, after, lo, self.hi)
+
+class ArrivalBoard:
+    """
+    Per-station arrival index over one FeedSnapshot, sorted by absolute epoch time.
+    next_departures() is a bisect plus a short forward walk, so a departure board can
+    re-render every second without touching the feed again.
+    Stations can be looked up by stop_name (e.g. 'Embarcadero'), parent_station code (e.g. 'EMBR'),
+    stop_id or anything the station search resolves (e.g. 'embarc'); either way every platform
+    of the station is included.
+    """
+
+    def __init__(self, snapshot: FeedSnapshot, trip_directions: dict = None):
+        """
+        trip_directions: optional {trip_id: direction_id} (see bart_data.load_trips) for direction filters.
+        """
+        self.snapshot = snapshot
+        self.stops = snapshot.stops
+        self.trip_directions = trip_directions or {}
+
+        self._table = snapshot.arrivals
+        self._stations = {code: _StationArrivals(lo, hi) for code, (lo, hi) in self._table.spans.items()}
+
+    def station_code(self, station: str) -> typing.Optional[str]:
+        if station in self._stations:
+            return station
+        match = station_index(self.stops).resolve(station)
+        return match.code if match is not None else None
+
+    def next_departures(self, station: str, n: int = 3, after: float = None,
+                        platform: str = None, direction: str = None) -> typing.List[typing.Tuple[str, int, str]]:
+        """
+        Next n trains at a station at or after `after` (default: now), soonest first.
+        platform filters on stops.txt platform_code, direction on trips.txt direction_id.
+        n=None returns every remaining arrival.
+        Returns: [(train_id, arrival_time, stop_id), ...]
+        """
+        arrivals = self._stations.get(self.station_code(station))
+        if arrivals is None:
+            return []
+
+        now = time.time()
+        if after is None:
+            after = now
+        table = self._table
+        arrivals.evict(table.times, now)
+
+        result = []
+        for j in range(arrivals.first(table.times, after), arrivals.hi):
+            if n is not None and len(result) >= n:
+                break
+            arrival_time, tid, sid = table.times[j], table.trip_ids[j], table.stop_ids[j]
+            if platform is not None and self.stops.get(sid, {}).get('platform_code') != platform:
+                continue
+            if direction is not None and self.trip_directions.get(tid) != direction:
+                continue
+            result.append((tid, arrival_time, sid))
+        return result
+
+    def minutes_until(self, station: str, n: int = 3, now: float = None, **filters) -> typing.List[typing.Tuple[str, int, str]]:
+        """
+        next_departures() with arrival times turned into whole minutes from now.
+        Returns: [(train_id, minutes, stop_id), ...]
+        """
+        if now is None:
+            now = time.time()
+        return [(tid, int((arrival_time - now) // 60), sid)
+                for tid, arrival_time, sid in self.next_departures(station, n, now, **filters)]
@@ -0,0 +1,433 @@
+"""
+Local HTTP/JSON arrivals API on top of bart_data.
+
+One background FeedPoller feeds every client. Each response body is serialized once per
+snapshot version (and, for bodies that drop already departed trains, at most every
+RENDER_TTL_SECONDS) and served from memory with an ETag, so request rate is independent
+of api.bart.gov and of the query functions.
+
+    GET /trains                        next stop of every active train
+    GET /trains/{trip_id}              remaining stops of one train
+    GET /stations                      stations that have predictions
+    GET /stations/{name}/arrivals      upcoming arrivals at every platform of a station, named by
+                                       stop_name, station code, stop_id or a partial name only
+                                       one station matches (e.g. "embarc"); otherwise 404
+    GET /search/{query}                stations matching a partial or misspelt name or code
+    GET /stream?stations=A,B&trips=X   Server-Sent Events: only the arrivals that changed
+                                       at the subscribed stations/trips after each refresh
+    GET /metrics                       stage timings and feed counters, Prometheus text format
+                                       (start with BART_METRICS=1 to record them)
+
+    python arrivals_server.py --port 8080
+"""
+import json
+import time
+import typing
+import hashlib
+import asyncio
+import argparse
+from collections import OrderedDict, defaultdict
+from urllib.parse import parse_qs, unquote, urlsplit, SplitResult
+from bart_data import FEED_URL, STOPS_FILE, FeedFetcher, FeedSnapshot, SnapshotDiff, diff_snapshots, load_stops
+from feed_poller import FeedPoller
+from gtfs_static import cached_table
+from station_search import Station, station_index
+from transit_model import station_codes
+import metrics
+
+MAX_HEADER_BYTES = 16 * 1024
+SUBSCRIBER_QUEUE_SIZE = 64    # pending events per stream client before it is dropped
+STREAM_PING_SECONDS = 15.0    # comment line sent to idle streams to detect dead sockets
+STATION_FIELDS = ('stop_id', 'name', 'code', 'parent_station')  # keys of each /stations entry
+RENDER_TTL_SECONDS = 10.0     # how long a body filtered on the current time is reused
+RENDER_CACHE_SIZE = 512       # rendered paths kept per snapshot, least recently used dropped first
+
+class Response:
+    """
+    A fully rendered response, reused for every request until the snapshot changes
+    or, when it has one, until its monotonic `expires` deadline passes.
+    """
+    __slots__ = ('status', 'body', 'etag', 'content_type', 'expires')
+
+    def __init__(self, status: int, body: bytes, etag: str = None, content_type: str = 'application/json',
+                 expires: float = None):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.content_type = content_type
+        self.expires = expires
+
+_REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+def _json(data) -> bytes:
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def _etag(body: bytes) -> str:
+    # derived from the bytes themselves, so it stays valid across restarts and re-renders
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+def _sse(event: str, data) -> bytes:
+    return f'event: {event}\ndata: '.encode('utf-8') + _json(data) + b'\n\n'
+
+def find_station(stops: dict, station: str) -> typing.Optional[Station]:
+    """
+    The station a stop_name, station code (e.g. EMBR), stop_id or unambiguous partial name
+    (e.g. "embarc") refers to, or None. Unlike /search there is no best guess.
+    """
+    return station_index(stops).match(station)
+
+class Subscriber:
+    """
+    One streaming client: the keys it follows ('station:<code>' / 'trip:<trip_id>') and a bounded queue.
+    """
+    __slots__ = ('keys', 'queue', 'dropped')
+
+    def __init__(self, keys: set):
+        self.keys = keys
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+class ArrivalsServer:
+    """
+    asyncio HTTP/1.1 server (keep-alive) serving arrivals from the latest FeedSnapshot.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8080, feed_url: str = FEED_URL,
+                 stops_file: str = STOPS_FILE, interval: float = 15.0):
+        self.host = host
+        self.port = port
+        self.snapshot = None
+        self.version = 0
+        self._cache = OrderedDict()  # path -> Response, valid for the current version only
+        self._stops = None  # stops table for resolving stream subscriptions before the first snapshot
+        self._subscribers = defaultdict(set)  # key -> {Subscriber, ...}
+        self._connections = set()  # open StreamWriters, closed on stop()
+        self._loop = None
+        self._server = None
+        self.poller = FeedPoller(on_snapshot=self._on_snapshot, on_error=self._on_error, interval=interval,
+                                 stops_file=stops_file, fetcher=FeedFetcher(feed_url))
+
+    # --- snapshot hand-off (poller thread -> event loop) ---
+
+    def _on_snapshot(self, snapshot: FeedSnapshot) -> None:
+        self._loop.call_soon_threadsafe(self.publish, snapshot)
+
+    def _on_error(self, error: Exception) -> None:
+        print(f"Feed refresh failed: {error}")
+
+    def publish(self, snapshot: FeedSnapshot) -> None:
+        """
+        Make a new snapshot current. Runs on the event loop thread.
+        """
+        old = self.snapshot
+        self.snapshot = snapshot
+        self.version += 1
+        self._cache.clear()
+        if old is not None and self._subscribers:
+            self._broadcast(old, snapshot, diff_snapshots(old, snapshot))
+
+    # --- streaming ---
+
+    def _change_events(self, old: FeedSnapshot, new: FeedSnapshot, diff: SnapshotDiff) -> typing.Dict[str, dict]:
+        """
+        Group one diff by subscription key.
+        Returns: {key: {'added': [...], 'changed': [...], 'removed': [...]}}
+        """
+        events = defaultdict(lambda: {'added': [], 'changed': [], 'removed': []})
+        codes = station_codes(new.stops)
+
+        def add(kind, tid, sid, entry):
+            events['trip:' + tid][kind].append(entry)
+            events['station:' + codes.get(sid, sid)][kind].append(entry)
+
+        for tid in diff.added_trips:
+            for sid, arrival_time in new.trip_updates[tid]:
+                add('added', tid, sid, {'trip_id': tid, 'stop_id': sid, 'arrival_time': arrival_time})
+        for tid in diff.removed_trips:
+            for sid, _ in old.trip_updates[tid]:
+                add('removed', tid, sid, {'trip_id': tid, 'stop_id': sid})
+        for tid, sid, old_time, new_time in diff.changed_predictions:
+            if old_time is None:
+                add('added', tid, sid, {'trip_id': tid, 'stop_id': sid, 'arrival_time': new_time})
+            elif new_time is None:
+                add('removed', tid, sid, {'trip_id': tid, 'stop_id': sid})
+            else:
+                add('changed', tid, sid, {'trip_id': tid, 'stop_id': sid,
+                                          'arrival_time': new_time, 'previous_time': old_time})
+        return events
+
+    def _broadcast(self, old: FeedSnapshot, new: FeedSnapshot, diff: SnapshotDiff) -> None:
+        """
+        Serialize each changed key once and queue it for every subscriber of that key.
+        A subscriber whose queue is full is dropped rather than slowing everyone else down.
+        """
+        for key, changes in self._change_events(old, new, diff).items():
+            subscribers = self._subscribers.get(key)
+            if not subscribers:
+                continue
+            payload = _sse('arrivals', dict(changes, key=key, version=self.version, feed_timestamp=new.timestamp))
+            for sub in list(subscribers):
+                try:
+                    sub.queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    self._drop(sub)
+
+    def _subscribe(self, sub: Subscriber) -> None:
+        for key in sub.keys:
+            self._subscribers[key].add(sub)
+
+    def _drop(self, sub: Subscriber) -> None:
+        if sub.dropped:
+            return
+        sub.dropped = True
+        for key in sub.keys:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(sub)
+                if not subscribers:
+                    del self._subscribers[key]
+        # wake the writer so it notices and closes the connection
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+
+    def _initial_events(self, sub: Subscriber) -> typing.List[bytes]:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return []
+        now = time.time()
+        events = []
+        for key in sorted(sub.keys):
+            kind, _, value = key.partition(':')
+            if kind == 'trip':
+                data = self._train(snapshot, value, now) or []
+            else:
+                data = self._arrivals(snapshot, value, now) or []
+            events.append(_sse('snapshot', {'key': key, 'version': self.version,
+                                            'feed_timestamp': snapshot.timestamp, 'data': data}))
+        return events
+
+    async def stream(self, url: SplitResult, writer: asyncio.StreamWriter) -> typing.Optional[Response]:
+        query = parse_qs(url.query)
+        stations = [s for v in query.get('stations', []) for s in v.split(',') if s]
+        trips = [t for v in query.get('trips', []) for t in v.split(',') if t]
+        if not stations and not trips:
+            return Response(400, _json({'error': 'subscribe with ?stations=... and/or ?trips=...'}))
+
+        keys = {'trip:' + t for t in trips}
+        stops = self.snapshot.stops if self.snapshot is not None else self._stops
+        for station in stations:
+            match = find_station(stops, station)
+            if match is None:
+                return Response(404, _json({'error': f'unknown station: {station}'}))
+            keys.add('station:' + match.code)
+
+        sub = Subscriber(keys)
+        self._subscribe(sub)
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+        try:
+            for event in self._initial_events(sub):
+                writer.write(event)
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    event = b': ping\n\n'
+                if event is None:
+                    break  # dropped for falling behind
+                writer.write(event)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._drop(sub)
+        return None
+
+    # --- rendering ---
+
+    def render(self, path: str) -> Response:
+        """
+        Cached response for a path under the current snapshot version. At most RENDER_CACHE_SIZE
+        paths are kept, so arbitrary /search and /trains paths cannot grow memory without limit.
+        """
+        cache = self._cache
+        response = cache.get(path)
+        if response is None or (response.expires is not None and time.monotonic() >= response.expires):
+            response = self._render(path)
+            if response.status != 200:
+                return response
+            cache[path] = response
+            if len(cache) > RENDER_CACHE_SIZE:
+                cache.popitem(last=False)
+        cache.move_to_end(path)
+        return response
+
+    def _render(self, path: str) -> Response:
+        snapshot = self.snapshot
+        if snapshot is None:
+            return Response(503, _json({'error': 'waiting for first feed'}))
+
+        parts = [unquote(p) for p in path.strip('/').split('/')]
+        now = time.time()
+        expires = time.monotonic() + RENDER_TTL_SECONDS  # for bodies filtered on `now`
+        if parts == ['trains']:
+            data = self._trains(snapshot, now)
+        elif len(parts) == 2 and parts[0] == 'trains':
+            data = self._train(snapshot, parts[1], now)
+        elif parts == ['stations']:
+            data = [{key: stop[key] for key in STATION_FIELDS} for stop in snapshot.all_stops.values()]
+            expires = None  # does not depend on the time, only on the snapshot
+        elif len(parts) == 3 and parts[0] == 'stations' and parts[2] == 'arrivals':
+            data = self._arrivals(snapshot, parts[1], now)
+        elif len(parts) == 2 and parts[0] == 'search':
+            data = [{'code': match.code, 'name': match.name, 'stop_ids': match.stop_ids}
+                    for match in station_index(snapshot.stops).search(parts[1])]
+            expires = None
+        else:
+            data = None
+        if data is None:
+            return Response(404, _json({'error': 'not found'}))
+
+        body = _json({'feed_timestamp': snapshot.timestamp, 'version': self.version, 'data': data})
+        return Response(200, body, etag=_etag(body), expires=expires)
+
+    def _trains(self, snapshot: FeedSnapshot, now: float) -> list:
+        trains = []
+        for tid, updates in snapshot.trip_updates.items():
+            for sid, arrival_time in updates:
+                if arrival_time >= now:
+                    trains.append({'trip_id': tid, 'stop_id': sid,
+                                   'stop_name': snapshot.stops.get(sid, {}).get('name', 'Unknown'),
+                                   'arrival_time': arrival_time})
+                    break
+        return trains
+
+    def _train(self, snapshot: FeedSnapshot, trip_id: str, now: float) -> typing.Optional[list]:
+        updates = snapshot.trip_updates.get(trip_id)
+        if updates is None:
+            return None
+        return [{'stop_id': sid, 'stop_name': snapshot.stops.get(sid, {}).get('name', 'Unknown'),
+                 'arrival_time': arrival_time}
+                for sid, arrival_time in updates if arrival_time >= now]
+
+    def _arrivals(self, snapshot: FeedSnapshot, station: str, now: float) -> typing.Optional[list]:
+        match = find_station(snapshot.stops, station)
+        if match is None:
+            return None
+        table = snapshot.arrivals
+        start, end = table.first_after(match.code, now)
+        return [{'trip_id': tid, 'stop_id': sid, 'arrival_time': arrival_time,
+                 'platform': snapshot.stops.get(sid, {}).get('platform_code', '')}
+                for arrival_time, tid, sid in zip(table.times[start:end], table.trip_ids[start:end],
+                                                  table.stop_ids[start:end])]
+
+    # --- HTTP ---
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._write(writer, Response(400, _json({'error': 'bad request line'})), close=True)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        key, value = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                if method != 'GET':
+                    response = Response(405, _json({'error': 'only GET is supported'}))
+                else:
+                    response = await self.dispatch(urlsplit(target), headers, reader, writer)
+                    if response is None:
+                        break  # the handler took over the connection (streaming)
+
+                if response.etag and headers.get('if-none-match') == response.etag:
+                    response = Response(304, b'', response.etag)
+                await self._write(writer, response, close=not keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def dispatch(self, url: SplitResult, headers: dict, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> typing.Optional[Response]:
+        """
+        Route one GET. Returning None means the handler wrote to and now owns the connection.
+        """
+        if url.path.rstrip('/') == '/stream':
+            return await self.stream(url, writer)
+        if url.path.rstrip('/') == '/metrics':
+            return Response(200, metrics.prometheus_text().encode('utf-8'),
+                            content_type='text/plain; version=0.0.4')
+        with metrics.timer('api_render'):
+            return self.render(url.path)
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, close: bool = False) -> None:
+        head = [f'HTTP/1.1 {response.status} {_REASONS.get(response.status, "")}',
+                f'Content-Length: {len(response.body)}',
+                'Cache-Control: no-cache']
+        if response.status != 304:
+            head.append(f'Content-Type: {response.content_type}')
+        if response.etag:
+            head.append(f'ETag: {response.etag}')
+        if close:
+            head.append('Connection: close')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + response.body)
+        await writer.drain()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        # parsed off the event loop, once; snapshots bring their own table afterwards
+        self._stops = await self._loop.run_in_executor(None, cached_table, self.poller.stops_file, load_stops)
+        self._server = await asyncio.start_server(self.handle, self.host, self.port, limit=MAX_HEADER_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.poller.start()
+
+    async def stop(self) -> None:
+        self._server.close()
+        # end open streams cleanly instead of leaving their tasks to be cancelled
+        for sub in {sub for subs in self._subscribers.values() for sub in subs}:
+            self._drop(sub)
+        for writer in list(self._connections):
+            writer.close()
+        await asyncio.sleep(0)
+        await self._server.wait_closed()
+        await asyncio.get_running_loop().run_in_executor(None, self.poller.stop, 5)
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        print(f"Serving arrivals on http://{self.host}:{self.port}/")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--feed-url', default=FEED_URL)
+    parser.add_argument('--stops-file', default=STOPS_FILE)
+    parser.add_argument('--interval', type=float, default=15.0, help='seconds between feed polls')
+    args = parser.parse_args()
+
+    server = ArrivalsServer(args.host, args.port, args.feed_url, args.stops_file, args.interval)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
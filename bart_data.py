@@ -1,64 +1,255 @@
+from __future__ import annotations  # annotations name protobuf/requests types without importing them
+
 import typing
 import csv
-import requests
 from datetime import datetime, timezone
 from collections import defaultdict
-from google.transit import gtfs_realtime_pb2
+import metrics
+from gtfs_static import cached_table
+from feed_decode import FeedColumns, decode_trip_updates, feed_rows
+from transit_model import Arrival, ArrivalTable, Stop, StopTable, stop_ids_by_name
+from station_search import station_index
+
+# requests (~80 ms) and the protobuf bindings (~20 ms) are imported by the functions that
+# fetch or parse, so importing bart_data for its tables and indexes stays cheap
+if typing.TYPE_CHECKING:
+    import requests
+    from google.transit import gtfs_realtime_pb2
 
 STOPS_FILE = 'google_transit_20250113-20250808_v10/stops.txt'
+TRIPS_FILE = 'google_transit_20250113-20250808_v10/trips.txt'
 FEED_URL   = 'http://api.bart.gov/gtfsrt/tripupdate.aspx'
 
-def load_stops(path: str = STOPS_FILE) -> dict:
+@metrics.timed('load_stops')
+def load_stops(path: str = STOPS_FILE) -> StopTable:
     """
-    Load GTFS static stops.txt into a dictionary.
-    Returns: {stop_id: {name, code, lat, lon, ...}}
+    Load GTFS static stops.txt into a dictionary of Stop records (read like dicts).
+    Returns: {stop_id: Stop(name, code, lat, lon, ...)}
     """
 
-    stops = {}
+    stops = StopTable()
     
     with open(path, newline='', encoding='utf-8') as f:
         for row in csv.DictReader(f):
-            stops[row['stop_id']] = {'name': row['stop_name'],
-                                     'code': row['stop_code'],
-                                     'zone_id': row['zone_id'],
-                                     'parent_station': row['parent_station'],
-                                     'platform_code': row['platform_code'],}
+            stops[row['stop_id']] = Stop(row['stop_id'],
+                                         row['stop_name'],
+                                         code=row['stop_code'],
+                                         lat=float(row['stop_lat']),
+                                         lon=float(row['stop_lon']),
+                                         zone_id=row['zone_id'],
+                                         parent_station=row['parent_station'],
+                                         platform_code=row['platform_code'],
+                                         location_type=row.get('location_type', ''))
         
     return stops
 
+def load_trips(path: str = TRIPS_FILE) -> dict:
+    """
+    Load GTFS static trips.txt into a dictionary.
+    Returns: {trip_id: {route_id, service_id, headsign, direction_id, shape_id}}
+    """
+
+    trips = {}
+
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            trips[row['trip_id']] = {'route_id': row['route_id'],
+                                     'service_id': row['service_id'],
+                                     'headsign': row['trip_headsign'],
+                                     'direction_id': row['direction_id'],
+                                     'shape_id': row['shape_id'],}
+
+    return trips
+
 def fetch_feed(url: str = FEED_URL) -> gtfs_realtime_pb2.FeedMessage:
     """
     Fetch and parse the GTFS-Realtime protobuf feed.
     Returns: FeedMessage object.
     """
+    import requests
+    from google.transit import gtfs_realtime_pb2
 
-    response = requests.get(url)
+    with metrics.timer('fetch'):
+        response = requests.get(url, timeout=(3.05, 10.0))
     response.raise_for_status()  # Raise an error for bad responses
+    metrics.count('feed_bytes', len(response.content))
     feed = gtfs_realtime_pb2.FeedMessage()
-    feed.ParseFromString(response.content)
+    with metrics.timer('parse'):
+        feed.ParseFromString(response.content)
     
     return feed
 
+def load_feed_file(path: str) -> gtfs_realtime_pb2.FeedMessage:
+    """
+    Load a FeedMessage saved to disk, either as raw protobuf bytes or as the
+    text dumps in output/ (e.g. output/bart_feed.txt).
+    Returns: FeedMessage object.
+    """
+    from google.protobuf import text_format
+    from google.transit import gtfs_realtime_pb2
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    if path.endswith('.txt'):
+        text_format.Parse(data.decode('utf-8'), feed)
+    else:
+        feed.ParseFromString(data)
+    return feed
+
+def peek_feed_timestamp(data: bytes) -> typing.Optional[int]:
+    """
+    Read header.timestamp without parsing the whole feed.
+    Relies on the header being serialized first, as every producer does; returns None otherwise.
+    """
+    from google.protobuf.message import DecodeError
+    from google.transit import gtfs_realtime_pb2
+
+    # field 1 (header), wire type 2 (length-delimited)
+    if not data or data[0] != 0x0A:
+        return None
+    length, shift, pos = 0, 0, 1
+    while pos < len(data):
+        b = data[pos]
+        length |= (b & 0x7F) << shift
+        pos += 1
+        if not b & 0x80:
+            break
+        shift += 7
+    header = gtfs_realtime_pb2.FeedHeader()
+    try:
+        header.ParseFromString(data[pos:pos + length])
+    except DecodeError:
+        return None
+    return header.timestamp
+
+class FeedFetcher:
+    """
+    Polls one GTFS-Realtime URL over a pooled keep-alive session.
+    Sends If-None-Match/If-Modified-Since, asks for gzip, retries with backoff,
+    and only calls ParseFromString when the feed actually changed.
+    """
+
+    def __init__(self, url: str = FEED_URL, timeout: typing.Tuple[float, float] = (3.05, 10.0),
+                 retries: int = 3, backoff: float = 0.5, session: requests.Session = None):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, allowed_methods=['GET'],
+                      status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        self.etag = None
+        self.last_modified = None
+        self.content = None
+        self.timestamp = None
+        self.feed = None
+        self.changed = False
+
+    def fetch(self) -> typing.Tuple[gtfs_realtime_pb2.FeedMessage, bool]:
+        """
+        Fetch the feed, reusing the previous FeedMessage when nothing changed.
+        Returns: (feed, changed)
+        """
+        headers = {}
+        if self.feed is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        with metrics.timer('fetch'):
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        self.changed = False
+        if response.status_code == 304:
+            metrics.count('feed_not_modified')
+            return self.feed, False
+        response.raise_for_status()  # Raise an error for bad responses
+
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+        data = response.content
+        metrics.count('feed_bytes', len(data))
+        if self.feed is not None and data == self.content:
+            metrics.count('feed_not_modified')
+            return self.feed, False
+        self.content = data
+
+        timestamp = peek_feed_timestamp(data)
+        if self.feed is not None and timestamp is not None and timestamp == self.timestamp:
+            metrics.count('feed_not_modified')
+            return self.feed, False
+
+        from google.transit import gtfs_realtime_pb2
+
+        feed = gtfs_realtime_pb2.FeedMessage()
+        with metrics.timer('parse'):
+            feed.ParseFromString(data)
+        self.feed = feed
+        self.timestamp = feed.header.timestamp
+        self.changed = True
+        return feed, True
+
+    def close(self) -> None:
+        self.session.close()
+
+# The module-level query functions answer one question per call. The first call on a feed scans
+# it directly (cheaper than indexing it for one answer); a second call on the same feed builds a
+# FeedSnapshot and every later call on that feed is served from it.
+_adapter_feed = None  # (feed, stops, header timestamp) of the most recent call
+_adapter_snapshot = None
+
+def _adapter_snapshot_for(feed: gtfs_realtime_pb2.FeedMessage, stops: dict) -> typing.Optional[FeedSnapshot]:
+    """
+    The memoized snapshot of feed, or None on the first call for this (feed, stops) pair.
+    """
+    global _adapter_feed, _adapter_snapshot
+    last, snapshot = _adapter_feed, _adapter_snapshot
+    timestamp = feed.header.timestamp
+    if last is None or last[0] is not feed or last[1] is not stops or last[2] != timestamp:
+        _adapter_feed, _adapter_snapshot = (feed, stops, timestamp), None
+        return None
+    if snapshot is None:
+        snapshot = _adapter_snapshot = FeedSnapshot.from_feed(feed, stops)
+    return snapshot
+
+def clear_adapter_cache() -> None:
+    """
+    Forget the memoized snapshot, so the next module-level query scans its feed again.
+    """
+    global _adapter_feed, _adapter_snapshot
+    _adapter_feed = _adapter_snapshot = None
+
+def _trip_updates(feed: gtfs_realtime_pb2.FeedMessage) -> typing.Iterator:
+    for ent in feed.entity:
+        if ent.HasField('trip_update'):
+            yield ent.trip_update
+
 def getNextByTrain(feed: gtfs_realtime_pb2.FeedMessage, stops: dict) -> dict:
     """
     Get the next stop and minutes for each train_id.
     Returns: {train_id: (stop_id, minutes)}
     """
+    snapshot = _adapter_snapshot_for(feed, stops)
+    if snapshot is not None:
+        return snapshot.next_by_train()
 
     now = datetime.now(timezone.utc).timestamp()
     next_by_train = {}
-
-    for ent in feed.entity:
-        if not ent.trip_update:
-            continue
-        tid = ent.trip_update.trip.trip_id
-        
-        # Find the first upcoming stop for each trip
-        for stu in ent.trip_update.stop_time_update:
-            if tid not in next_by_train and stu.arrival and stu.arrival.time >= now:
-                mins = int((stu.arrival.time - now) // 60)
-                sid = stu.stop_id
-                next_by_train[tid] = (sid, mins)
+    for tu in _trip_updates(feed):
+        for stu in tu.stop_time_update:
+            arrival_time = stu.arrival.time
+            if arrival_time >= now:
+                next_by_train[tu.trip.trip_id] = (stu.stop_id, int((arrival_time - now) // 60))
                 break
     return next_by_train
 
@@ -67,98 +258,344 @@ def get_train_schedule(feed: gtfs_realtime_pb2.FeedMessage, stops: dict, train_i
     Get all future stops and arrival times for a given train_id.
     Returns: [(stop_name, stop_id, minutes), ...]
     """
+    snapshot = _adapter_snapshot_for(feed, stops)
+    if snapshot is not None:
+        return snapshot.train_schedule(train_id)
 
     now = datetime.now(timezone.utc).timestamp()
-    for ent in feed.entity:
-        if ent.trip_update and ent.trip_update.trip.trip_id == train_id:
-            schedule = []
-            for stu in ent.trip_update.stop_time_update:
-                if stu.arrival and stu.arrival.time >= now:
-                    mins = int((stu.arrival.time - now) // 60)
-                    sid = stu.stop_id
-                    stop_name = stops.get(sid, {}).get('name', 'Unknown')
-                    schedule.append((stop_name, sid, mins))
-            return schedule
+    for tu in _trip_updates(feed):
+        if tu.trip.trip_id == train_id:
+            return [(stops.get(stu.stop_id, {}).get('name', 'Unknown'), stu.stop_id, int((stu.arrival.time - now) // 60))
+                    for stu in tu.stop_time_update if stu.arrival.time >= now]
     return []
 
 def get_stop_arrivals(feed: gtfs_realtime_pb2.FeedMessage, stops: dict, stop_name: str) -> list:
     """
-    Get all trains arriving soon at a given stop (by stop_id or name).
+    Get all trains arriving soon at a station, at any of its platforms, soonest first.
+    The station is named by a stop_name, station code, stop_id or unambiguous partial name
+    (see StationIndex.match); anything else has no arrivals.
     Returns: [(train_id, minutes, stop_id, stop_name), ...]
     """
+    snapshot = _adapter_snapshot_for(feed, stops)
+    if snapshot is not None:
+        return snapshot.stop_arrivals(stop_name)
 
+    station = station_index(stops).match(stop_name)
+    if station is None:
+        return []
     now = datetime.now(timezone.utc).timestamp()
-    arrivals = []
-    stops_in_station = []
-    
-    # Find all stop_ids that match the given stop_name
-    for stop_id, stop_info in stops.items():
-        if stop_info.get('name') == stop_name:
-            stops_in_station.append(stop_id)
-
-    for ent in feed.entity:
-        if not ent.trip_update:
-            continue
-        for stu in ent.trip_update.stop_time_update:
-            if stu.stop_id in stops_in_station and stu.arrival and stu.arrival.time >= now:
-                mins = int((stu.arrival.time - now) // 60)
-                tid = ent.trip_update.trip.trip_id
-                arrivals.append((tid, mins, stu.stop_id, stop_name))
-
-    return arrivals
+    stop_ids = set(station.stop_ids)
+    found = [(stu.arrival.time, tu.trip.trip_id, stu.stop_id)
+             for tu in _trip_updates(feed) for stu in tu.stop_time_update
+             if stu.stop_id in stop_ids and stu.arrival.time >= now]
+    found.sort()
+    return [Arrival(tid, int((arrival_time - now) // 60), sid, stops[sid].get('name'))
+            for arrival_time, tid, sid in found]
 
+@metrics.timed('get_all_stops')
 def get_all_stops(feed: gtfs_realtime_pb2.FeedMessage, stops: dict) -> dict:
     """
     Get all stops that have predictions from the static GTFS data.
-    Returns: {stop_id: {name, code, lat, lon, ...}}
+    Returns: {stop_name: Stop(stop_id, name, code, parent_station, ...)}
     """
+    snapshot = _adapter_snapshot_for(feed, stops)
+    if snapshot is not None:
+        return dict(snapshot.all_stops)  # a copy: callers may edit it, the snapshot is shared
+
     all_stops = {}
+    seen = set()
+    for tu in _trip_updates(feed):
+        for stu in tu.stop_time_update:
+            sid = stu.stop_id
+            if sid in seen or not stu.arrival.time:
+                continue
+            seen.add(sid)
+            stop = stops.get(sid)
+            if stop is None:
+                stop = Stop(sid, 'Unknown', 'N/A', parent_station='None')
+            all_stops.setdefault(stop.get('name'), stop)
+    return all_stops
 
-    for ent in feed.entity:
-        if not ent.trip_update:
+class FeedSnapshot:
+    """
+    Indexed view of one fetched feed, built in a single pass.
+    Every query is a dictionary lookup instead of a walk over feed.entity.
+    Arrival times are stored as absolute epochs; minutes are computed at query time.
+    """
+
+    def __init__(self, stops: dict, rows: typing.List[typing.Tuple[str, str, int]], timestamp: int = 0,
+                 feed: gtfs_realtime_pb2.FeedMessage = None):
+        """
+        Build the indexes from flat (trip_id, stop_id, arrival_time) rows in feed order (see feed_decode).
+        """
+        self.stops = stops
+        self.feed = feed
+        self.rows = rows
+        self.timestamp = timestamp
+        self._columns = None
+        self._arrivals = None
+        self._arrivals_by_stop = None
+        self._arrivals_by_name = None
+
+        # trip_id -> [(stop_id, arrival_time), ...] in feed order
+        self.trip_updates = {}
+        # stop_name -> [stop_id, ...], shared by every snapshot of the same StopTable
+        self.stop_ids_by_name = stop_ids_by_name(stops)
+        # stop_name -> Stop of the first stop_id with a prediction, in feed order
+        self.all_stops = {}
+
+        trip_updates, all_stops = self.trip_updates, self.all_stops
+        seen = set()
+        for tid, sid, arrival_time in rows:
+            updates = trip_updates.get(tid)
+            if updates is None:
+                updates = trip_updates[tid] = []
+            updates.append((sid, arrival_time))
+            if arrival_time and sid not in seen:
+                seen.add(sid)
+                stop = stops.get(sid)
+                if stop is None:
+                    stop = Stop(sid, 'Unknown', 'N/A', parent_station='None')
+                if stop.get('name') not in all_stops:
+                    all_stops[stop.get('name')] = stop
+
+    @property
+    def arrivals(self) -> ArrivalTable:
+        """
+        Time-sorted arrivals of every station across all its platforms, as flat arrays.
+        Built on the first arrival query, so polls nobody looks at never pay for it.
+        """
+        if self._arrivals is None:
+            self._arrivals = ArrivalTable(self.rows, self.stops)
+        return self._arrivals
+
+    @property
+    def arrivals_by_stop(self) -> typing.Dict[str, typing.List[typing.Tuple[int, str, str]]]:
+        """
+        stop_id -> [(arrival_time, trip_id, stop_id), ...] sorted by time, built on first use.
+        """
+        if self._arrivals_by_stop is None:
+            by_stop = defaultdict(list)
+            for tid, sid, arrival_time in self.rows:
+                if arrival_time:
+                    by_stop[sid].append((arrival_time, tid, sid))
+            for arrivals in by_stop.values():
+                arrivals.sort()
+            self._arrivals_by_stop = by_stop
+        return self._arrivals_by_stop
+
+    @property
+    def arrivals_by_name(self) -> typing.Dict[str, typing.List[typing.Tuple[int, str, str]]]:
+        """
+        stop_name -> [(arrival_time, trip_id, stop_id), ...] sorted by time, built on first use
+        for callers that want tuples. Stations are better looked up through stop_arrivals,
+        since one station's platforms may carry different stop_names.
+        """
+        if self._arrivals_by_name is None:
+            by_name = defaultdict(list)
+            for sid, arrivals in self.arrivals_by_stop.items():
+                stop = self.stops.get(sid)
+                if stop is not None:
+                    by_name[stop.get('name')].extend(arrivals)
+            for arrivals in by_name.values():
+                arrivals.sort()
+            self._arrivals_by_name = by_name
+        return self._arrivals_by_name
+
+    @property
+    def columns(self) -> FeedColumns:
+        """
+        The rows as interned array columns, built on first use (e.g. by delays.DelayEngine).
+        """
+        if self._columns is None:
+            self._columns = FeedColumns.from_rows(self.rows, self.timestamp)
+        return self._columns
+
+    @classmethod
+    def from_feed(cls, feed: gtfs_realtime_pb2.FeedMessage, stops: dict) -> 'FeedSnapshot':
+        """
+        Flatten a parsed FeedMessage into rows and index them.
+        Returns: FeedSnapshot
+        """
+        with metrics.timer('feed_rows'):
+            rows = feed_rows(feed)
+        metrics.count('feed_entities', len(feed.entity))
+        metrics.count('feed_stop_time_updates', len(rows))
+        with metrics.timer('snapshot_index'):
+            return cls(stops, rows, feed.header.timestamp, feed)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, stops: dict) -> 'FeedSnapshot':
+        """
+        Decode raw feed bytes straight into rows and index them; no FeedMessage is kept.
+        Returns: FeedSnapshot
+        """
+        with metrics.timer('decode'):
+            timestamp, rows = decode_trip_updates(data)
+        metrics.count('feed_bytes', len(data))
+        metrics.count('feed_stop_time_updates', len(rows))
+        with metrics.timer('snapshot_index'):
+            return cls(stops, rows, timestamp)
+
+    @metrics.timed('next_by_train')
+    def next_by_train(self, now: float = None) -> dict:
+        """
+        Get the next stop and minutes for each train_id.
+        Returns: {train_id: (stop_id, minutes)}
+        """
+        if now is None:
+            now = datetime.now(timezone.utc).timestamp()
+        next_by_train = {}
+
+        for tid, updates in self.trip_updates.items():
+            for sid, arrival_time in updates:
+                if arrival_time >= now:
+                    next_by_train[tid] = (sid, int((arrival_time - now) // 60))
+                    break
+        return next_by_train
+
+    @metrics.timed('train_schedule')
+    def train_schedule(self, train_id: str, now: float = None) -> list:
+        """
+        Get all future stops and arrival times for a given train_id.
+        Returns: [(stop_name, stop_id, minutes), ...]
+        """
+        if now is None:
+            now = datetime.now(timezone.utc).timestamp()
+
+        return [(self.stops.get(sid, {}).get('name', 'Unknown'), sid, int((arrival_time - now) // 60))
+                for sid, arrival_time in self.trip_updates.get(train_id, ())
+                if arrival_time >= now]
+
+    @metrics.timed('stop_arrivals')
+    def stop_arrivals(self, stop_name: str, now: float = None) -> list:
+        """
+        Get all trains arriving soon at a station, at any of its platforms, soonest first.
+        The station is named by a stop_name, station code (e.g. "MLBR"), stop_id or a partial
+        name only one station matches (e.g. "millbrae"); anything else has no arrivals.
+        Returns: [Arrival(train_id, minutes, stop_id, stop_name), ...]
+        """
+        if now is None:
+            now = datetime.now(timezone.utc).timestamp()
+
+        station = station_index(self.stops).match(stop_name)
+        if station is None:
+            return []
+        stops = self.stops
+        table = self.arrivals
+        start, end = table.first_after(station.code, now)
+        return [Arrival(tid, int((arrival_time - now) // 60), sid, stops[sid].get('name'))
+                for arrival_time, tid, sid in zip(table.times[start:end], table.trip_ids[start:end],
+                                                  table.stop_ids[start:end])]
+
+
+class SnapshotDiff:
+    """
+    What changed between two consecutive FeedSnapshots.
+    changed_predictions: [(trip_id, stop_id, old_time, new_time), ...] where a time is None
+    when the prediction appeared or disappeared within a trip present in both snapshots.
+    """
+
+    def __init__(self, added_trips: set, removed_trips: set, changed_predictions: list, affected_stations: set):
+        self.added_trips = added_trips
+        self.removed_trips = removed_trips
+        self.changed_predictions = changed_predictions
+        self.affected_stations = affected_stations
+
+    def __bool__(self) -> bool:
+        return bool(self.added_trips or self.removed_trips or self.changed_predictions)
+
+    @property
+    def changed_trips(self) -> set:
+        """
+        Trips present in both snapshots whose predictions moved.
+        """
+        return {tid for tid, _, _, _ in self.changed_predictions}
+
+    def deltas(self) -> typing.List[typing.Tuple[str, str, int]]:
+        """
+        How far each surviving prediction moved, in seconds (positive = later).
+        Returns: [(trip_id, stop_id, delta_seconds), ...]
+        """
+        return [(tid, sid, new_time - old_time) for tid, sid, old_time, new_time in self.changed_predictions
+                if old_time is not None and new_time is not None]
+
+@metrics.timed('diff')
+def diff_snapshots(old: typing.Optional[FeedSnapshot], new: FeedSnapshot) -> SnapshotDiff:
+    """
+    Compare two snapshots trip by trip. Trips whose update lists are identical are
+    skipped with a single list comparison, so a quiet poll costs O(trips).
+    Returns: SnapshotDiff
+    """
+    old_trips = old.trip_updates if old is not None else {}
+    new_trips = new.trip_updates
+    stops = new.stops
+
+    added = new_trips.keys() - old_trips.keys()
+    removed = old_trips.keys() - new_trips.keys()
+    changed = []
+    touched_stops = set()
+
+    for tid in added:
+        touched_stops.update(sid for sid, _ in new_trips[tid])
+    for tid in removed:
+        touched_stops.update(sid for sid, _ in old_trips[tid])
+
+    for tid, new_updates in new_trips.items():
+        old_updates = old_trips.get(tid)
+        if old_updates is None or old_updates == new_updates:
             continue
-        tid = ent.trip_update.trip.trip_id
-        for stu in ent.trip_update.stop_time_update:
-            if not stu.arrival or not stu.arrival.time:
-                continue
 
-            stop_id = stu.stop_id
-            stop_name = stops.get(stop_id, {}).get('name', 'Unknown')
-            parent_station = stops.get(stop_id, {}).get('parent_station', 'None')
-
-            if stop_name not in all_stops:
-                all_stops[stop_name] = {
-                    'stop_id': stop_id,
-                    'name': stop_name,
-                    'code': stops.get(stop_id, {}).get('code', 'N/A'),
-                    'parent_station': parent_station,
-                }
-        
-    return all_stops
+        old_times = dict(old_updates)
+        new_times = dict(new_updates)
+        for sid in old_times.keys() | new_times.keys():
+            old_time = old_times.get(sid)
+            new_time = new_times.get(sid)
+            if old_time != new_time:
+                changed.append((tid, sid, old_time, new_time))
+                touched_stops.add(sid)
 
-def refresh_data(stops_file: str, feed_url: str) -> typing.Tuple[dict, gtfs_realtime_pb2.FeedMessage, dict, dict, dict]:
+    affected = {stops.get(sid, {}).get('name', 'Unknown') for sid in touched_stops}
+    return SnapshotDiff(set(added), set(removed), changed, affected)
+
+def refresh_snapshot(stops_file: str, feed_url: str, fetcher: FeedFetcher = None) -> FeedSnapshot:
     """
-    Reload stops and fetch the latest feed.
-    Returns: (stops, feed, nextByTrain, byStop, allStops)
+    Fetch the latest feed and index it once.
+    stops.txt is only re-parsed when the file changes on disk. Pass a FeedFetcher
+    to reuse its connection and conditional-request state between refreshes.
+    Returns: FeedSnapshot
     """
-    stops = load_stops(stops_file)
-    feed = fetch_feed(feed_url)
+    stops = cached_table(stops_file, load_stops)
+    if fetcher is None:
+        feed = fetch_feed(feed_url)
+    else:
+        feed, _ = fetcher.fetch()
 
-    next_by_train = getNextByTrain(feed, stops)
-    allStops = get_all_stops(feed, stops)
+    return FeedSnapshot.from_feed(feed, stops)
 
-    return stops, feed, next_by_train, allStops
+def refresh_data(stops_file: str, feed_url: str,
+                 fetcher: FeedFetcher = None) -> typing.Tuple[dict, gtfs_realtime_pb2.FeedMessage, dict, dict]:
+    """
+    Reload stops and fetch the latest feed (see refresh_snapshot for the indexed form).
+    The snapshot is kept for the module-level query functions, so calling them on the
+    returned feed and stops does not index the feed again.
+    Returns: (stops, feed, nextByTrain, allStops)
+    """
+    global _adapter_feed, _adapter_snapshot
+    snapshot = refresh_snapshot(stops_file, feed_url, fetcher)
+    feed, stops = snapshot.feed, snapshot.stops
+    _adapter_feed, _adapter_snapshot = (feed, stops, snapshot.timestamp), snapshot
+    return stops, feed, snapshot.next_by_train(), dict(snapshot.all_stops)
 
 if __name__ == "__main__":
 
     #test the functions
-    stops, feed, getNextByTrain, allStops = refresh_data(STOPS_FILE, FEED_URL)
+    snapshot = refresh_snapshot(STOPS_FILE, FEED_URL)
     
     # test get all stops
-    all_stops = get_all_stops(feed, stops)
-    print("All Stops:", all_stops)
+    print("All Stops:", snapshot.all_stops)
 
     # test get_stop_arrivals
     stop_name = 'Embarcadero'
-    arrivals = get_stop_arrivals(feed, stops, stop_name)
-    print(f"Arrivals at {stop_name}:", arrivals)
\ No newline at end of file
+    arrivals = snapshot.stop_arrivals(stop_name)
+    print(f"Arrivals at {stop_name}:", arrivals)
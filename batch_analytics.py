@@ -0,0 +1,293 @@
+"""
+Batch analytics over a feed archive written by feed_archive.FeedRecorder.
+
+Segments are split across a process pool. Each worker decodes its frames into columns and
+reduces them to the latest prediction per (service day, trip, stop), which is the best
+estimate of when the train actually arrived and left. BART reuses trip_ids every day, so the
+service day (the trip's start_date, else the feed's local date) keeps days apart. Partials
+are merged as arrays by feed timestamp, then headways, dwell times and schedule delays are
+computed with NumPy and written as CSV.
+
+    python batch_analytics.py output/archive --workers 8 --output output/analytics
+"""
+import os
+import csv
+import typing
+import argparse
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from zoneinfo import ZoneInfo
+from google.transit import gtfs_realtime_pb2
+from bart_data import STOPS_FILE, load_stops
+from delays import DelayEngine, load_agency_timezone, service_day_start
+from feed_archive import ARCHIVE_DIR, SEGMENT_SUFFIX, SegmentReader
+from feed_decode import FeedColumns
+from gtfs_static import STATIC_DIR, cached_table
+from gtfs_tables import stop_times
+
+OUTPUT_DIR = 'output/analytics'
+PERCENTILES = [50, 90, 99]
+DELAY_BINS = np.arange(-600, 3601, 60)  # one-minute delay histogram buckets, seconds
+SERVICE_DAY_CUTOFF = 3 * 3600  # feeds before 3am local time still describe the previous day's trains
+COMPACT_ROWS = 1 << 20  # buffered rows per worker before reducing them to the latest per key
+
+class Observations:
+    """
+    Latest prediction per (service day, trip, stop) as parallel NumPy columns.
+    day is the service date as a date.toordinal(); trip/stop index trip_ids/stop_ids;
+    seen is the timestamp of the feed the prediction came from.
+    """
+
+    def __init__(self, trip_ids: typing.List[str], stop_ids: typing.List[str], day: np.ndarray,
+                 trip: np.ndarray, stop: np.ndarray, seen: np.ndarray, arrival: np.ndarray, departure: np.ndarray):
+        self.trip_ids = trip_ids
+        self.stop_ids = stop_ids
+        self.day = day
+        self.trip = trip
+        self.stop = stop
+        self.seen = seen
+        self.arrival = arrival
+        self.departure = departure
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @classmethod
+    def concatenate(cls, trip_ids: typing.List[str], stop_ids: typing.List[str],
+                    chunks: typing.List[typing.Tuple[np.ndarray, ...]]) -> 'Observations':
+        """
+        Stack (day, trip, stop, seen, arrival, departure) chunks that share trip_ids/stop_ids.
+        """
+        if not chunks:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(trip_ids, stop_ids, empty, empty, empty, empty, empty, empty)
+        return cls(trip_ids, stop_ids, *(np.concatenate(column) for column in zip(*chunks)))
+
+    def latest(self) -> 'Observations':
+        """
+        Keep the row from the newest feed for each (day, trip, stop); on equal timestamps the
+        later row wins, as if the frames had been replayed in order.
+        """
+        order = np.lexsort((self.seen, self.stop, self.trip, self.day))  # stable: ties keep row order
+        day, trip, stop = self.day[order], self.trip[order], self.stop[order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (day[1:] != day[:-1]) | (trip[1:] != trip[:-1]) | (stop[1:] != stop[:-1])
+        keep = order[last]
+        return Observations(self.trip_ids, self.stop_ids, self.day[keep], self.trip[keep], self.stop[keep],
+                            self.seen[keep], self.arrival[keep], self.departure[keep])
+
+def _codes(ids: typing.List[str], index: dict) -> np.ndarray:
+    # map one table's string codes onto a shared index, adding unseen strings
+    return np.array([index.setdefault(i, len(index)) for i in ids], dtype=np.int64)
+
+def _service_day(timestamp: int, tz: ZoneInfo) -> int:
+    return datetime.fromtimestamp(timestamp - SERVICE_DAY_CUTOFF, tz).date().toordinal()
+
+def _trip_days(start_dates: typing.List[str], feed_day: int, parsed: dict) -> np.ndarray:
+    # service day of each trip: its start_date when the feed gives one, else the feed's own
+    days = []
+    for value in start_dates:
+        if not value:
+            days.append(feed_day)
+            continue
+        day = parsed.get(value)
+        if day is None:
+            day = parsed[value] = datetime.strptime(value, '%Y%m%d').toordinal()
+        days.append(day)
+    return np.array(days, dtype=np.int64)
+
+def analyze_segment(path: str, start: int = None, end: int = None, tz: ZoneInfo = None) -> typing.Tuple[int, Observations]:
+    """
+    Worker: reduce one segment to its latest observation per (service day, trip, stop).
+    Returns: (frames read, observations)
+    """
+    tz = tz or load_agency_timezone()
+    reader = SegmentReader(path)
+    trip_index, stop_index, dates = {}, {}, {}
+    chunks, buffered = [], 0
+    frames = 0
+    feed = gtfs_realtime_pb2.FeedMessage()
+    try:
+        first = reader.seek(start) if start is not None else 0
+        for i in range(first, len(reader)):
+            timestamp, data = reader.frame(i)
+            if end is not None and timestamp >= end:
+                break
+            feed.ParseFromString(data)
+            frames += 1
+            columns = FeedColumns.from_feed(feed, full=True)
+            if not len(columns):
+                continue
+
+            trip_day = _trip_days(columns.start_dates, _service_day(timestamp, tz), dates)
+            trip = np.frombuffer(columns.trip, dtype=np.int32)
+            chunks.append((trip_day[trip], _codes(columns.trip_ids, trip_index)[trip],
+                           _codes(columns.stop_ids, stop_index)[np.frombuffer(columns.stop, dtype=np.int32)],
+                           np.full(len(trip), timestamp, dtype=np.int64),
+                           np.frombuffer(columns.time, dtype=np.int64).copy(),
+                           np.frombuffer(columns.departure, dtype=np.int64).copy()))
+            buffered += len(trip)
+            if buffered >= COMPACT_ROWS:
+                latest = Observations.concatenate(list(trip_index), list(stop_index), chunks).latest()
+                chunks = [(latest.day, latest.trip, latest.stop, latest.seen, latest.arrival, latest.departure)]
+                buffered = len(latest)
+    finally:
+        reader.close()
+    return frames, Observations.concatenate(list(trip_index), list(stop_index), chunks).latest()
+
+def merge_observations(partials: typing.Iterable[Observations]) -> Observations:
+    """
+    Combine worker results onto shared trip/stop codes, keeping the observation from the
+    newest feed for each (service day, trip, stop).
+    """
+    trip_index, stop_index = {}, {}
+    chunks = []
+    for part in partials:
+        trips, stops = _codes(part.trip_ids, trip_index), _codes(part.stop_ids, stop_index)
+        chunks.append((part.day, trips[part.trip], stops[part.stop], part.seen, part.arrival, part.departure))
+    return Observations.concatenate(list(trip_index), list(stop_index), chunks).latest()
+
+def _stats(values: np.ndarray) -> list:
+    if not len(values):
+        return [0, '', ''] + [''] * len(PERCENTILES)
+    return ([len(values), round(float(values.mean()), 1), round(float(values.std()), 1)]
+            + [round(float(p), 1) for p in np.percentile(values, PERCENTILES)])
+
+def _grouped_stats(groups: np.ndarray, values: np.ndarray, names: typing.List[str]) -> typing.List[list]:
+    # sort once, then split into runs of equal group code
+    order = np.argsort(groups, kind='stable')
+    groups, values = groups[order], values[order]
+    cuts = np.flatnonzero(np.diff(groups)) + 1
+    rows = []
+    for g, chunk in zip(np.split(groups, cuts), np.split(values, cuts)):
+        if len(g):
+            rows.append([names[g[0]]] + _stats(chunk))
+    return rows
+
+class ArchiveReport:
+    """
+    Final aggregates over merged observations, as parallel arrays keyed by static stop codes.
+    """
+
+    def __init__(self, observations: Observations, stops: dict, static_dir: str = STATIC_DIR):
+        self.stops = stops
+        self.table = stop_times(static_dir)
+        self.day, self.seen = observations.day, observations.seen
+        self.arrival, self.departure = observations.arrival, observations.departure
+        self.trip_ids = [observations.trip_ids[t] for t in observations.trip.tolist()]
+        self.stop_ids = [observations.stop_ids[s] for s in observations.stop.tolist()]
+
+        # stations group platforms under their parent_station
+        station_of = [stops.get(sid, {}).get('parent_station') or sid for sid in self.stop_ids]
+        self.station_names = sorted(set(station_of))
+        index = {s: i for i, s in enumerate(self.station_names)}
+        self.station = np.array([index[s] for s in station_of], dtype=np.int64)
+        self.platform_names = sorted(set(self.stop_ids))
+        index = {s: i for i, s in enumerate(self.platform_names)}
+        self.platform = np.array([index[s] for s in self.stop_ids], dtype=np.int64)
+
+    def headways(self) -> typing.List[list]:
+        """
+        Time between consecutive arrivals at each platform (one platform = one direction),
+        within a service day so the overnight gap is not counted.
+        """
+        has_time = self.arrival > 0
+        platform, day, arrival = self.platform[has_time], self.day[has_time], self.arrival[has_time]
+        order = np.lexsort((arrival, day, platform))
+        platform, day, arrival = platform[order], day[order], arrival[order]
+        gap = np.diff(arrival)
+        same = (platform[1:] == platform[:-1]) & (day[1:] == day[:-1])
+        return _grouped_stats(platform[1:][same], gap[same], self.platform_names)
+
+    def dwells(self) -> typing.List[list]:
+        """
+        Departure minus arrival at each platform, where the feed predicted both.
+        """
+        both = (self.arrival > 0) & (self.departure >= self.arrival)
+        return _grouped_stats(self.platform[both], self.departure[both] - self.arrival[both], self.platform_names)
+
+    def delays(self, tz=None) -> typing.Tuple[typing.List[list], np.ndarray]:
+        """
+        Final predicted arrival against stop_times.txt, per station, plus a system-wide histogram.
+        """
+        engine = DelayEngine(self.table, tz)
+        trips, stops = engine.encode(self.trip_ids, self.stop_ids)
+        has_time = self.arrival > 0
+        # each observation is matched against the schedules around its service day;
+        # compute() only needs `now` to the day, so run it once per service day at its noon
+        rows, delays = [], []
+        for d in np.unique(self.day[has_time]).tolist():
+            pick = has_time & (self.day == d)
+            noon = service_day_start(datetime.fromordinal(d).date(), engine.tz) + 12 * 3600
+            result = engine.compute(trips[pick], stops[pick], self.arrival[pick], noon)
+            rows.append(result.stop)
+            delays.append(result.delay)
+        if not rows:
+            return [], np.zeros(len(DELAY_BINS) - 1, dtype=np.int64)
+        stop_codes, delay = np.concatenate(rows), np.concatenate(delays)
+        index = {s: i for i, s in enumerate(self.station_names)}
+        station = np.array([index.get(self.stops.get(sid, {}).get('parent_station') or sid, -1)
+                            for sid in self.table.stop_ids], dtype=np.int64)[stop_codes]
+        known = station >= 0
+        histogram, _ = np.histogram(np.clip(delay, DELAY_BINS[0], DELAY_BINS[-1] - 1), bins=DELAY_BINS)
+        return _grouped_stats(station[known], delay[known], self.station_names), histogram
+
+def _write_csv(path: str, header: typing.List[str], rows: typing.Iterable[list]) -> None:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def segment_paths(directory: str = ARCHIVE_DIR) -> typing.List[str]:
+    """
+    Segment files of an archive, largest first so the pool finishes evenly.
+    """
+    paths = [os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(SEGMENT_SUFFIX)]
+    return sorted(paths, key=os.path.getsize, reverse=True)
+
+def run(directory: str = ARCHIVE_DIR, output_dir: str = OUTPUT_DIR, workers: int = None,
+        start: int = None, end: int = None, stops_file: str = STOPS_FILE) -> dict:
+    """
+    Analyze every segment in directory across a process pool and write the CSV reports.
+    Returns: {report name: path written}, plus 'frames' and 'observations' counts
+    """
+    paths = segment_paths(directory)
+    n = len(paths)
+    tz = load_agency_timezone()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(analyze_segment, paths, [start] * n, [end] * n, [tz] * n))
+    frames = sum(f for f, _ in results)
+    observations = merge_observations(partial for _, partial in results)
+
+    report = ArchiveReport(observations, cached_table(stops_file, load_stops))
+    os.makedirs(output_dir, exist_ok=True)
+    stat_columns = ['count', 'mean', 'std'] + [f'p{p}' for p in PERCENTILES]
+    written = {'frames': frames, 'observations': len(observations)}
+
+    written['headways'] = os.path.join(output_dir, 'headways.csv')
+    _write_csv(written['headways'], ['stop_id'] + stat_columns, report.headways())
+    written['dwells'] = os.path.join(output_dir, 'dwells.csv')
+    _write_csv(written['dwells'], ['stop_id'] + stat_columns, report.dwells())
+
+    station_delays, histogram = report.delays()
+    written['delays'] = os.path.join(output_dir, 'delays.csv')
+    _write_csv(written['delays'], ['station'] + stat_columns, station_delays)
+    written['delay_histogram'] = os.path.join(output_dir, 'delay_histogram.csv')
+    _write_csv(written['delay_histogram'], ['delay_from', 'delay_to', 'count'],
+               zip(DELAY_BINS[:-1].tolist(), DELAY_BINS[1:].tolist(), histogram.tolist()))
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archive', nargs='?', default=ARCHIVE_DIR)
+    parser.add_argument('--output', default=OUTPUT_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per core)')
+    parser.add_argument('--start', type=int, default=None, help='first feed timestamp to include')
+    parser.add_argument('--end', type=int, default=None, help='feed timestamp to stop before')
+    args = parser.parse_args()
+
+    written = run(args.archive, args.output, args.workers, args.start, args.end)
+    print(f"{written.pop('frames')} feeds, {written.pop('observations')} train/stop observations")
+    for name, path in written.items():
+        print(f"{name}: {path}")
@@ -0,0 +1,173 @@
+"""
+Offline benchmarks for the bart_data hot paths.
+
+Synthetic FeedMessages are built from the static GTFS: N active trips with real trip_ids
+and their real stop sequences from stop_times.txt, each caught somewhere mid-route.
+Every query function and the full refresh_data pipeline (against local_feed_server)
+is timed per feed size, reporting ops/sec, latency percentiles and peak traced memory.
+
+    python bench_bart_data.py --sizes 50 200 1000 --repeat 200
+"""
+import gc
+import time
+import random
+import typing
+import argparse
+import tracemalloc
+from google.protobuf.internal import api_implementation
+from google.transit import gtfs_realtime_pb2
+from bart_data import (STOPS_FILE, FeedFetcher, FeedSnapshot, clear_adapter_cache, getNextByTrain, get_all_stops,
+                       get_stop_arrivals, get_train_schedule, load_stops, refresh_data)
+from gtfs_tables import stop_times
+from local_feed_server import FeedServer, serve_feed
+
+DEFAULT_SIZES = [50, 200, 1000, 5000]
+
+def synthetic_feed(n_trips: int, now: int = None, seed: int = 0) -> gtfs_realtime_pb2.FeedMessage:
+    """
+    Build a FeedMessage with n_trips trips taken from stop_times.txt, each part-way along its route.
+    Trips are reused with a suffix once n_trips exceeds the static feed's trip count.
+    """
+    if now is None:
+        now = int(time.time())
+    rng = random.Random(seed)
+    table = stop_times()
+
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = '1.0'
+    feed.header.incrementality = gtfs_realtime_pb2.FeedHeader.FULL_DATASET
+    feed.header.timestamp = now
+
+    for i in range(n_trips):
+        code = i % len(table.trip_ids)
+        tid = table.trip_ids[code]
+        if i >= len(table.trip_ids):
+            tid = f'{tid}-{i // len(table.trip_ids)}'
+        rows = table.trip_rows(table.trip_ids[code])
+        times = table.arrival[rows]
+        stop_codes = table.stop[rows]
+
+        # catch the train just before a random stop on its route
+        k = rng.randrange(len(times))
+        shift = now + rng.randrange(0, 120) - int(times[k])
+
+        ent = feed.entity.add()
+        ent.id = tid
+        ent.trip_update.trip.trip_id = tid
+        for arrival, stop in zip(times[k:], stop_codes[k:]):
+            stu = ent.trip_update.stop_time_update.add()
+            stu.stop_id = table.stop_ids[stop]
+            stu.arrival.time = int(arrival) + shift
+            stu.departure.time = int(arrival) + shift + 20
+    return feed
+
+def one_off(fn: typing.Callable[[], typing.Any]) -> typing.Callable[[], typing.Any]:
+    """
+    fn with the adapters' memoized snapshot dropped first, so every call takes the scan path.
+    """
+    def run():
+        clear_adapter_cache()
+        return fn()
+    return run
+
+def measure(fn: typing.Callable[[], typing.Any], repeat: int) -> dict:
+    """
+    Time fn() repeat times, then once more under tracemalloc for peak memory.
+    """
+    fn()  # warm caches
+    samples = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    def pct(p):
+        return samples[min(int(p / 100 * len(samples)), len(samples) - 1)]
+    return {'ops': len(samples) / sum(samples), 'p50': pct(50), 'p95': pct(95), 'p99': pct(99), 'peak': peak}
+
+def bench_size(n_trips: int, repeat: int, server: FeedServer) -> typing.Tuple[int, typing.List[typing.Tuple[str, dict]]]:
+    now = int(time.time())
+    feed = synthetic_feed(n_trips, now)
+    data = feed.SerializeToString()
+    stops = load_stops(STOPS_FILE)
+    snapshot = FeedSnapshot.from_feed(feed, stops)
+    train_id = feed.entity[0].trip_update.trip.trip_id
+    station = 'Embarcadero'
+    n_updates = sum(len(e.trip_update.stop_time_update) for e in feed.entity)
+
+    server.set_feed(data)
+    fetcher = FeedFetcher(server.url)
+
+    def parse():
+        gtfs_realtime_pb2.FeedMessage().ParseFromString(data)
+
+    def refresh():
+        # force a full download + parse each time instead of a 304
+        fetcher.etag = fetcher.last_modified = None
+        fetcher.feed = None
+        refresh_data(STOPS_FILE, server.url, fetcher)
+
+    cases = [
+        ('load_stops', lambda: load_stops(STOPS_FILE)),
+        ('ParseFromString', parse),
+        # one-off calls: the adapters scan the feed (see bart_data._adapter_snapshot_for)
+        ('getNextByTrain', one_off(lambda: getNextByTrain(feed, stops))),
+        ('get_train_schedule', one_off(lambda: get_train_schedule(feed, stops, train_id))),
+        ('get_stop_arrivals', one_off(lambda: get_stop_arrivals(feed, stops, station))),
+        ('get_all_stops', one_off(lambda: get_all_stops(feed, stops))),
+        # repeated calls on the same feed, served from the memoized snapshot
+        ('getNextByTrain (memoized)', lambda: getNextByTrain(feed, stops)),
+        ('get_train_schedule (memoized)', lambda: get_train_schedule(feed, stops, train_id)),
+        ('get_stop_arrivals (memoized)', lambda: get_stop_arrivals(feed, stops, station)),
+        ('get_all_stops (memoized)', lambda: get_all_stops(feed, stops)),
+        ('FeedSnapshot.from_feed', lambda: FeedSnapshot.from_feed(feed, stops)),
+        ('FeedSnapshot.from_bytes', lambda: FeedSnapshot.from_bytes(data, stops)),
+        ('snapshot.next_by_train', lambda: snapshot.next_by_train(now)),
+        ('snapshot.stop_arrivals', lambda: snapshot.stop_arrivals(station, now)),
+        ('refresh_data (local HTTP)', refresh),
+    ]
+    results = [(name, measure(fn, repeat)) for name, fn in cases]
+    fetcher.close()
+    return n_updates, results
+
+def format_results(n_trips: int, n_updates: int, results: typing.List[typing.Tuple[str, dict]]) -> str:
+    lines = [f"--- {n_trips} trips, {n_updates} stop_time_updates ---",
+             f"{'case':<32}{'ops/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}"]
+    for name, r in results:
+        lines.append(f"{name:<32}{r['ops']:>12.1f}{r['p50'] * 1e3:>10.3f}{r['p95'] * 1e3:>10.3f}"
+                     f"{r['p99'] * 1e3:>10.3f}{r['peak'] / 1024:>11.1f}")
+    return '\n'.join(lines)
+
+def main(argv: typing.List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='active trips per synthetic feed')
+    parser.add_argument('--repeat', type=int, default=100, help='timed calls per case')
+    parser.add_argument('--output', help='also write the report to this file (e.g. bench_output.txt)')
+    args = parser.parse_args(argv)
+
+    server = serve_feed()
+    report = [f"bart_data benchmarks, protobuf backend: {api_implementation.Type()}"]
+    try:
+        for n in args.sizes:
+            n_updates, results = bench_size(n, args.repeat, server)
+            report.append(format_results(n, n_updates, results))
+            print(report[-1], flush=True)
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write('\n\n'.join(report) + '\n')
+
+if __name__ == "__main__":
+    main()
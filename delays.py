@@ -0,0 +1,211 @@
+import csv
+import typing
+import numpy as np
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from bart_data import FeedSnapshot
+from feed_decode import FeedColumns
+from gtfs_static import STATIC_DIR, static_path
+from gtfs_tables import StopTimes
+
+def load_agency_timezone(path: str = static_path('agency.txt')) -> ZoneInfo:
+    """
+    Timezone that all stop_times.txt times are expressed in.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        return ZoneInfo(next(csv.DictReader(f))['agency_timezone'])
+
+def service_day_start(date, tz: ZoneInfo) -> int:
+    """
+    Epoch of a service day's time origin: noon minus 12 hours, as the GTFS spec defines it,
+    so that DST change days still line up with the published times.
+    """
+    noon = datetime(date.year, date.month, date.day, 12, tzinfo=tz)
+    return int(noon.timestamp()) - 12 * 3600
+
+def occurrences(keys: np.ndarray) -> np.ndarray:
+    """
+    For each key, how many times it already appeared earlier in the array (0, 1, ...).
+    """
+    n = len(keys)
+    order = np.argsort(keys, kind='stable')
+    ordered = keys[order]
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    run_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+    result = np.empty(n, dtype=np.int64)
+    result[order] = np.arange(n) - run_start
+    return result
+
+class DelayEngine:
+    """
+    Joins realtime predictions to stop_times.txt and reports schedule adherence, using sorted
+    join keys and NumPy throughout. A prediction carrying a stop_sequence is joined on
+    (trip_id, stop_sequence); otherwise the n-th prediction for a (trip_id, stop_id) pair is
+    joined to the n-th scheduled row of that pair, so trips that call at a stop twice (the
+    SFO Y10 loop) compare each call with its own time.
+    Build once per static feed; compute() is then cheap enough for every poll.
+    """
+
+    def __init__(self, stop_times: StopTimes, tz: ZoneInfo = None, static_dir: str = STATIC_DIR):
+        self.stop_times = stop_times
+        self.tz = tz or load_agency_timezone(static_path('agency.txt', static_dir))
+
+        # join key = trip code * n_stops + stop code, sorted once; the sort is stable, so the
+        # repeated calls of a trip at one stop stay in stop_sequence order within their run
+        self.n_stops = len(stop_times.stop_ids)
+        keys = stop_times.trip.astype(np.int64) * self.n_stops + stop_times.stop
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+
+        # second join key = trip code * n_sequences + stop_sequence
+        self.n_sequences = int(stop_times.stop_sequence.max()) + 1 if len(stop_times) else 1
+        seq_keys = stop_times.trip.astype(np.int64) * self.n_sequences + stop_times.stop_sequence
+        self._seq_order = np.argsort(seq_keys, kind='stable')
+        self._seq_keys = seq_keys[self._seq_order]
+
+    def encode(self, trip_ids: typing.Sequence[str], stop_ids: typing.Sequence[str]) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Map realtime ids to the static table's integer codes (-1 when unknown).
+        """
+        trip_index = self.stop_times.trip_index
+        stop_index = self.stop_times.stop_index
+        trips = np.fromiter((trip_index.get(t, -1) for t in trip_ids), dtype=np.int64, count=len(trip_ids))
+        stops = np.fromiter((stop_index.get(s, -1) for s in stop_ids), dtype=np.int64, count=len(stop_ids))
+        return trips, stops
+
+    def compute(self, trips: np.ndarray, stops: np.ndarray, predicted: np.ndarray, now: float,
+                sequence: np.ndarray = None, occurrence: np.ndarray = None) -> 'DelayResult':
+        """
+        Delay of every prediction whose scheduled row exists.
+        trips/stops are codes from encode(); predicted holds arrival epochs.
+        sequence: the predictions' stop_sequence (-1 when absent).
+        occurrence: how many earlier predictions of the same trip named the same stop;
+        by default counted from the arrays themselves, which must then be in feed order.
+        """
+        trips = np.asarray(trips, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        known = (trips >= 0) & (stops >= 0)
+        keys = np.where(known, trips * self.n_stops + stops, -1)
+        if occurrence is None:
+            occurrence = occurrences(keys)
+        last = len(self._keys) - 1
+        pos = np.minimum(np.searchsorted(self._keys, keys) + occurrence, last)
+        matched = known & (self._keys[pos] == keys)
+        row_of = np.where(matched, self._order[pos], -1)
+
+        if sequence is not None:
+            sequence = np.asarray(sequence, dtype=np.int64)
+            by_seq = known & (sequence >= 0)
+            seq_keys = np.where(by_seq, trips * self.n_sequences + sequence, -1)
+            pos = np.minimum(np.searchsorted(self._seq_keys, seq_keys), len(self._seq_keys) - 1)
+            found = by_seq & (self._seq_keys[pos] == seq_keys)
+            rows = self._seq_order[pos]
+            found &= self.stop_times.stop[rows] == stops  # the sequence must name the same stop
+            row_of = np.where(found, rows, row_of)
+            matched |= found
+
+        rows = row_of[matched]
+        seconds = self.stop_times.arrival[rows].astype(np.int64)
+        predicted = np.asarray(predicted, dtype=np.int64)[matched]
+
+        # A prediction belongs to today's or yesterday's service day (times past 24:00
+        # run into the next calendar day); take whichever schedule it sits closest to.
+        today = datetime.fromtimestamp(now, self.tz).date()
+        bases = np.array([service_day_start(today - timedelta(days=d), self.tz) for d in (1, 0, -1)], dtype=np.int64)
+        candidates = predicted[None, :] - (bases[:, None] + seconds[None, :])
+        best = np.abs(candidates).argmin(axis=0)
+        delay = candidates[best, np.arange(len(best))]
+        # rows whose scheduled arrival time is blank cannot be compared
+        valid = seconds >= 0
+
+        return DelayResult(self.stop_times, trips[matched][valid], stops[matched][valid],
+                           predicted[valid], delay[valid], int(len(trips) - valid.sum()))
+
+    def encode_columns(self, columns: FeedColumns) -> typing.Tuple[np.ndarray, ...]:
+        """
+        Map a decoded feed onto static codes, looking each distinct id up once.
+        Rows without an arrival time are dropped, after counting occurrences over every row.
+        Returns: (trip codes, stop codes, arrival epochs, stop_sequences or None, occurrences)
+        """
+        trip_codes, stop_codes = self.encode(columns.trip_ids, columns.stop_ids)
+        predicted = np.frombuffer(columns.time, dtype=np.int64)
+        has_time = predicted != 0
+        trips = trip_codes[np.frombuffer(columns.trip, dtype=np.int32)]
+        stops = stop_codes[np.frombuffer(columns.stop, dtype=np.int32)]
+        occurrence = occurrences(np.where((trips >= 0) & (stops >= 0), trips * self.n_stops + stops, -1))
+        sequence = None
+        if columns.sequence is not None:
+            sequence = np.frombuffer(columns.sequence, dtype=np.int32)[has_time]
+        return trips[has_time], stops[has_time], predicted[has_time], sequence, occurrence[has_time]
+
+    def compute_snapshot(self, snapshot: FeedSnapshot, now: float = None) -> 'DelayResult':
+        trips, stops, predicted, sequence, occurrence = self.encode_columns(snapshot.columns)
+        return self.compute(trips, stops, predicted, now if now is not None else snapshot.timestamp,
+                            sequence, occurrence)
+
+class DelayResult:
+    """
+    Matched predictions with their delay in seconds (positive = late), as parallel arrays.
+    trip/stop are codes into stop_times.trip_ids / stop_times.stop_ids.
+    """
+
+    def __init__(self, stop_times: StopTimes, trip: np.ndarray, stop: np.ndarray,
+                 predicted: np.ndarray, delay: np.ndarray, unmatched: int):
+        self.stop_times = stop_times
+        self.trip = trip
+        self.stop = stop
+        self.predicted = predicted
+        self.delay = delay
+        self.unmatched = unmatched
+
+    def __len__(self) -> int:
+        return len(self.delay)
+
+    def _grouped_mean(self, codes: np.ndarray, n: int) -> typing.Tuple[np.ndarray, np.ndarray]:
+        counts = np.bincount(codes, minlength=n)
+        sums = np.bincount(codes, weights=self.delay, minlength=n)
+        present = np.flatnonzero(counts)
+        return present, sums[present] / counts[present]
+
+    def per_trip(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean delay per trip.
+        Returns: (trip codes, mean delay seconds)
+        """
+        return self._grouped_mean(self.trip, len(self.stop_times.trip_ids))
+
+    def per_stop(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean delay per platform stop_id.
+        Returns: (stop codes, mean delay seconds)
+        """
+        return self._grouped_mean(self.stop, len(self.stop_times.stop_ids))
+
+    def per_station(self, stops: dict) -> typing.Tuple[typing.List[str], np.ndarray]:
+        """
+        Mean delay per parent_station, folding platforms together.
+        Returns: (station codes, mean delay seconds)
+        """
+        stations = sorted({stops.get(sid, {}).get('parent_station') or sid for sid in self.stop_times.stop_ids})
+        station_index = {s: i for i, s in enumerate(stations)}
+        stop_to_station = np.array([station_index[stops.get(sid, {}).get('parent_station') or sid]
+                                    for sid in self.stop_times.stop_ids], dtype=np.int64)
+        present, means = self._grouped_mean(stop_to_station[self.stop], len(stations))
+        return [stations[i] for i in present], means
+
+    def summary(self, late_after: int = 300) -> dict:
+        """
+        System-wide delay statistics in seconds.
+        """
+        if not len(self.delay):
+            return {'count': 0, 'unmatched': self.unmatched}
+        p50, p90, p99 = np.percentile(self.delay, [50, 90, 99])
+        return {'count': len(self.delay),
+                'unmatched': self.unmatched,
+                'mean': float(self.delay.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': int(self.delay.max()),
+                'late_share': float((self.delay > late_after).mean())}
@@ -0,0 +1,99 @@
+import os
+import csv
+import typing
+import numpy as np
+from gtfs_static import STATIC_DIR, cached_table, static_path
+
+# Row 0 of the matrix is the full fare from fare_attributes.txt
+FULL_FARE = ''
+NO_FARE = -1
+
+class FareMatrix:
+    """
+    Every fare in the static feed as one dense int32 array of cents,
+    indexed [rider category, origin zone, destination zone] (NO_FARE where no rule applies).
+    categories[0] is FULL_FARE; the rest are rider_category_ids.
+    """
+
+    def __init__(self, zone_ids: typing.List[str], categories: typing.List[str], cents: np.ndarray):
+        self.zone_ids = zone_ids
+        self.zone_index = {z: i for i, z in enumerate(zone_ids)}
+        self.categories = categories
+        self.category_index = {c: i for i, c in enumerate(categories)}
+        self.cents = cents
+
+    def encode_zones(self, zone_ids: typing.Sequence[str]) -> np.ndarray:
+        """
+        zone_ids to matrix codes (-1 when unknown).
+        """
+        index = self.zone_index
+        return np.fromiter((index.get(z, -1) for z in zone_ids), dtype=np.int64, count=len(zone_ids))
+
+    def encode_stops(self, stop_ids: typing.Sequence[str], stops: dict) -> np.ndarray:
+        """
+        stop_ids to matrix codes through the zone_id each stop carries in stops.txt.
+        """
+        return self.encode_zones([stops.get(sid, {}).get('zone_id', '') for sid in stop_ids])
+
+    def price(self, origin_zone: str, destination_zone: str, category: str = FULL_FARE) -> typing.Optional[float]:
+        """
+        Fare in dollars between two zones, or None when the feed has no rule for the pair.
+        """
+        o, d = self.zone_index.get(origin_zone), self.zone_index.get(destination_zone)
+        c = self.category_index.get(category)
+        if o is None or d is None or c is None:
+            return None
+        cents = int(self.cents[c, o, d])
+        return None if cents == NO_FARE else cents / 100
+
+    def prices(self, origins: np.ndarray, destinations: np.ndarray, category: str = FULL_FARE) -> np.ndarray:
+        """
+        Bulk lookup: fares in cents for arrays of zone codes (from encode_zones/encode_stops),
+        in one fancy index. Unknown zones or missing rules give NO_FARE.
+        """
+        origins = np.asarray(origins, dtype=np.int64)
+        destinations = np.asarray(destinations, dtype=np.int64)
+        known = (origins >= 0) & (destinations >= 0)
+        cents = self.cents[self.category_index[category]][np.where(known, origins, 0), np.where(known, destinations, 0)]
+        return np.where(known, cents, NO_FARE)
+
+def _read_rows(path: str) -> typing.List[dict]:
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def _cents(value: str) -> int:
+    return int(round(float(value) * 100))
+
+def load_fares(path: str = static_path('fare_rules.txt')) -> FareMatrix:
+    """
+    Compile fare_rules.txt with fare_attributes.txt and fare_rider_categories.txt
+    (read from the same directory) into a FareMatrix. Rules scoped by route_id or
+    contains_id do not occur in this feed and are skipped.
+    """
+    directory = os.path.dirname(path)
+    rules = [r for r in _read_rows(path) if not r.get('route_id') and not r.get('contains_id')]
+    full = {r['fare_id']: _cents(r['price']) for r in _read_rows(os.path.join(directory, 'fare_attributes.txt'))}
+    by_category = {}
+    for r in _read_rows(os.path.join(directory, 'fare_rider_categories.txt')):
+        by_category.setdefault(r['rider_category_id'], {})[r['fare_id']] = _cents(r['price'])
+
+    zone_ids = sorted({r['origin_id'] for r in rules} | {r['destination_id'] for r in rules})
+    zone_index = {z: i for i, z in enumerate(zone_ids)}
+    categories = [FULL_FARE] + sorted(by_category, key=int)
+    cents = np.full((len(categories), len(zone_ids), len(zone_ids)), NO_FARE, dtype=np.int32)
+    for r in rules:
+        o, d, fare_id = zone_index[r['origin_id']], zone_index[r['destination_id']], r['fare_id']
+        for c, category in enumerate(categories):
+            price = full.get(fare_id) if category == FULL_FARE else by_category[category].get(fare_id)
+            if price is not None:
+                cents[c, o, d] = price
+    return FareMatrix(zone_ids, categories, cents)
+
+def fare_matrix(static_dir: str = STATIC_DIR) -> FareMatrix:
+    """
+    The compiled fare matrix, built once and cached until fare_rules.txt, fare_attributes.txt
+    or fare_rider_categories.txt changes.
+    """
+    return cached_table(static_path('fare_rules.txt', static_dir), load_fares,
+                        depends_on=[static_path('fare_attributes.txt', static_dir),
+                                    static_path('fare_rider_categories.txt', static_dir)])
@@ -0,0 +1,192 @@
+import os
+import sys
+import mmap
+import time
+import array
+import bisect
+import struct
+import typing
+from google.transit import gtfs_realtime_pb2
+from bart_data import FeedSnapshot
+
+ARCHIVE_DIR = 'output/archive'
+
+# Every frame in a segment: <u64 feed timestamp><u32 payload length><payload (raw protobuf bytes)>
+FRAME_HEADER = struct.Struct('<QI')
+# Every entry in a segment's .idx file: <u64 feed timestamp><u64 frame offset>
+INDEX_ENTRY = struct.Struct('<QQ')
+
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+
+class FeedRecorder:
+    """
+    Appends raw FeedMessage bytes to rotating segment files, with a small time index per segment.
+    A segment is closed once it holds segment_seconds of feed time or reaches max_bytes.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_seconds: int = 3600, max_bytes: int = 64 << 20):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self._segment = None
+        self._index = None
+        self._segment_start = None
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, data: bytes, timestamp: int) -> None:
+        """
+        Store one feed payload under its header timestamp.
+        """
+        if (self._segment is None or timestamp - self._segment_start >= self.segment_seconds
+                or self._segment.tell() >= self.max_bytes):
+            self._rotate(timestamp)
+
+        offset = self._segment.tell()
+        self._segment.write(FRAME_HEADER.pack(timestamp, len(data)))
+        self._segment.write(data)
+        self._segment.flush()
+        self._index.write(INDEX_ENTRY.pack(timestamp, offset))
+        self._index.flush()
+
+    def append_feed(self, feed: gtfs_realtime_pb2.FeedMessage) -> None:
+        self.append(feed.SerializeToString(), feed.header.timestamp)
+
+    def _rotate(self, timestamp: int) -> None:
+        self.close()
+        base = os.path.join(self.directory, f'feed-{timestamp}')
+        self._segment = open(base + SEGMENT_SUFFIX, 'ab')
+        self._index = open(base + INDEX_SUFFIX, 'ab')
+        self._segment_start = timestamp
+
+    def close(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+            self._segment = self._index = None
+
+class SegmentReader:
+    """
+    Memory-maps one segment and its time index for random access by timestamp.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.timestamps, self.offsets = self._load_index(path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+
+    def _load_index(self, index_path: str) -> typing.Tuple[array.array, array.array]:
+        entries = array.array('Q')
+        try:
+            with open(index_path, 'rb') as f:
+                data = f.read()
+            entries.frombytes(data[:len(data) - len(data) % INDEX_ENTRY.size])
+        except OSError:
+            return self._scan()
+        if sys.byteorder != 'little':
+            entries.byteswap()
+
+        timestamps, offsets = entries[0::2], entries[1::2]
+        # A crash can leave the index behind the segment; fall back to scanning it
+        if offsets and self._frame_end(offsets[-1]) != len(self._map):
+            return self._scan()
+        if not offsets and len(self._map):
+            return self._scan()
+        return timestamps, offsets
+
+    def _frame_end(self, offset: int) -> int:
+        _, length = FRAME_HEADER.unpack_from(self._map, offset)
+        return offset + FRAME_HEADER.size + length
+
+    def _scan(self) -> typing.Tuple[array.array, array.array]:
+        timestamps, offsets = array.array('Q'), array.array('Q')
+        offset, size = 0, len(self._map)
+        while offset + FRAME_HEADER.size <= size:
+            timestamp, length = FRAME_HEADER.unpack_from(self._map, offset)
+            if offset + FRAME_HEADER.size + length > size:
+                break  # torn final frame
+            timestamps.append(timestamp)
+            offsets.append(offset)
+            offset += FRAME_HEADER.size + length
+        return timestamps, offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def frame(self, i: int) -> typing.Tuple[int, bytes]:
+        offset = self.offsets[i]
+        timestamp, length = FRAME_HEADER.unpack_from(self._map, offset)
+        start = offset + FRAME_HEADER.size
+        return timestamp, self._map[start:start + length]
+
+    def seek(self, timestamp: int) -> int:
+        """
+        Index of the first frame at or after timestamp.
+        """
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    def close(self) -> None:
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+class FeedReplay:
+    """
+    Reads an archive directory written by FeedRecorder, oldest segment first.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+        names = [n for n in os.listdir(directory) if n.endswith(SEGMENT_SUFFIX)]
+        # segment names carry their first timestamp, so sort numerically
+        names.sort(key=lambda n: int(n[len('feed-'):-len(SEGMENT_SUFFIX)]))
+        self.segments = [SegmentReader(os.path.join(directory, n)) for n in names]
+        self._starts = [seg.timestamps[0] if len(seg) else 0 for seg in self.segments]
+
+    def frames(self, start: int = None, end: int = None) -> typing.Iterator[typing.Tuple[int, bytes]]:
+        """
+        Yield (timestamp, raw bytes) for every stored feed with start <= timestamp < end.
+        """
+        first = 0
+        if start is not None:
+            first = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        for seg in self.segments[first:]:
+            i = seg.seek(start) if start is not None else 0
+            for j in range(i, len(seg)):
+                timestamp, data = seg.frame(j)
+                if end is not None and timestamp >= end:
+                    return
+                yield timestamp, data
+
+    def feeds(self, start: int = None, end: int = None) -> typing.Iterator[gtfs_realtime_pb2.FeedMessage]:
+        for _, data in self.frames(start, end):
+            feed = gtfs_realtime_pb2.FeedMessage()
+            feed.ParseFromString(data)
+            yield feed
+
+    def snapshots(self, stops: dict, start: int = None, end: int = None,
+                  speed: float = None) -> typing.Iterator[FeedSnapshot]:
+        """
+        Replay stored feeds as FeedSnapshots. speed=None runs as fast as possible,
+        otherwise feed time is compressed by that factor (speed=60 plays an hour in a minute).
+        """
+        prev = None
+        for feed in self.feeds(start, end):
+            if speed and prev is not None:
+                time.sleep(max(feed.header.timestamp - prev, 0) / speed)
+            prev = feed.header.timestamp
+            yield FeedSnapshot.from_feed(feed, stops)
+
+    def close(self) -> None:
+        for seg in self.segments:
+            seg.close()
+
+if __name__ == "__main__":
+    # summarize an archive: python feed_archive.py [directory]
+    replay = FeedReplay(sys.argv[1] if len(sys.argv) > 1 else ARCHIVE_DIR)
+    for seg in replay.segments:
+        if len(seg):
+            print(f"{os.path.basename(seg.path)}: {len(seg)} feeds, {seg.timestamps[0]} - {seg.timestamps[-1]}")
+    replay.close()
@@ -0,0 +1,116 @@
+from __future__ import annotations  # the protobuf bindings load on first decode, not on import
+
+import array
+import typing
+
+if typing.TYPE_CHECKING:
+    from google.transit import gtfs_realtime_pb2
+
+class FeedColumns:
+    """
+    The parts of a TripUpdate feed that bart_data queries, as flat parallel columns.
+    Row i is one StopTimeUpdate: trip_ids[trip[i]], stop_ids[stop[i]], arrival epoch time[i]
+    (0 when the update has no arrival time). Rows keep feed order.
+    Decoded with full=True, departure[i] is the departure epoch (0 when absent), sequence[i]
+    the update's stop_sequence (-1 when absent) and start_dates[t] the trip descriptor's
+    start_date of trip_ids[t] ('' when absent).
+    """
+
+    def __init__(self, timestamp: int, trip_ids: typing.List[str], stop_ids: typing.List[str],
+                 trip: array.array, stop: array.array, time: array.array,
+                 departure: array.array = None, start_dates: typing.List[str] = None,
+                 sequence: array.array = None):
+        self.timestamp = timestamp
+        self.trip_ids = trip_ids
+        self.stop_ids = stop_ids
+        self.trip = trip
+        self.stop = stop
+        self.time = time
+        self.departure = departure
+        self.start_dates = start_dates
+        self.sequence = sequence
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @classmethod
+    def from_rows(cls, rows: typing.Sequence[typing.Tuple[str, str, int]], timestamp: int = 0) -> 'FeedColumns':
+        """
+        Intern (trip_id, stop_id, arrival_time) rows into columns.
+        """
+        trip_index, stop_index = {}, {}
+        trip = array.array('i', [trip_index.setdefault(tid, len(trip_index)) for tid, _, _ in rows])
+        stop = array.array('i', [stop_index.setdefault(sid, len(stop_index)) for _, sid, _ in rows])
+        time = array.array('q', [arrival_time for _, _, arrival_time in rows])
+        return cls(timestamp, list(trip_index), list(stop_index), trip, stop, time)
+
+    @classmethod
+    def from_feed(cls, feed: gtfs_realtime_pb2.FeedMessage, full: bool = False) -> 'FeedColumns':
+        """
+        One pass over a parsed feed straight into columns, like feed_rows without the tuples.
+        full=True also reads departure times, stop_sequences and trip start_dates
+        (for archive analytics and schedule joins).
+        """
+        trip_index, stop_index = {}, {}
+        trip, stop, time = array.array('i'), array.array('i'), array.array('q')
+        departure = array.array('q') if full else None
+        sequence = array.array('i') if full else None
+        start_dates = [] if full else None
+        for ent in feed.entity:
+            if not ent.HasField('trip_update'):
+                continue
+            tu = ent.trip_update
+            tid = tu.trip.trip_id
+            t = trip_index.get(tid)
+            if t is None:
+                t = trip_index[tid] = len(trip_index)
+                if full:
+                    start_dates.append(tu.trip.start_date)
+            for stu in tu.stop_time_update:
+                sid = stu.stop_id
+                s = stop_index.get(sid)
+                if s is None:
+                    s = stop_index[sid] = len(stop_index)
+                trip.append(t)
+                stop.append(s)
+                time.append(stu.arrival.time)
+                if full:
+                    departure.append(stu.departure.time)
+                    sequence.append(stu.stop_sequence if stu.HasField('stop_sequence') else -1)
+        return cls(feed.header.timestamp, list(trip_index), list(stop_index), trip, stop, time,
+                   departure, start_dates, sequence)
+
+    def rows(self) -> typing.List[typing.Tuple[str, str, int]]:
+        """
+        (trip_id, stop_id, arrival_time) in feed order, as FeedSnapshot expects.
+        """
+        trip_ids, stop_ids = self.trip_ids, self.stop_ids
+        return [(trip_ids[t], stop_ids[s], arrival_time) for t, s, arrival_time in zip(self.trip, self.stop, self.time)]
+
+def feed_rows(feed: gtfs_realtime_pb2.FeedMessage) -> typing.List[typing.Tuple[str, str, int]]:
+    """
+    One tight pass over a parsed feed, touching only trip_id, stop_id and arrival.time.
+    Nested messages are bound to locals once, so each StopTimeUpdate costs two attribute reads.
+    Returns: [(trip_id, stop_id, arrival_time), ...] in feed order (0 = no arrival time)
+    """
+    rows = []
+    add = rows.append
+    for ent in feed.entity:
+        if not ent.HasField('trip_update'):
+            continue
+        tu = ent.trip_update
+        tid = tu.trip.trip_id
+        for stu in tu.stop_time_update:
+            add((tid, stu.stop_id, stu.arrival.time))
+    return rows
+
+def decode_trip_updates(data: bytes) -> typing.Tuple[int, typing.List[typing.Tuple[str, str, int]]]:
+    """
+    Parse raw FeedMessage bytes with the protobuf runtime (upb where installed) and flatten
+    them straight into rows, without keeping the message around.
+    Returns: (header timestamp, rows)
+    """
+    from google.transit import gtfs_realtime_pb2
+
+    feed = gtfs_realtime_pb2.FeedMessage.FromString(data)
+    return feed.header.timestamp, feed_rows(feed)
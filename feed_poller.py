@@ -0,0 +1,130 @@
+import os
+import time
+import typing
+import threading
+import metrics
+from bart_data import STOPS_FILE, FEED_URL, FeedFetcher, FeedSnapshot, load_stops
+from gtfs_static import CACHE_DIR, cached_table
+
+LAST_FEED_FILE = os.path.join(CACHE_DIR, 'last_feed.pb')  # newest raw feed, so a restart has data at once
+
+class FeedPoller:
+    """
+    Polls the realtime feed on a background thread and builds a FeedSnapshot off the caller's thread.
+    Each new snapshot is passed to on_snapshot (called on the polling thread; GUIs should hand it over
+    through a queue drained with root.after). Failures go to on_error and polling carries on.
+    With last_feed_file set, every new feed is saved there and the thread starts by delivering
+    the saved one, so a restart shows (possibly stale) data before the first fetch returns.
+    """
+
+    def __init__(self, on_snapshot: typing.Callable[[FeedSnapshot], None],
+                 on_error: typing.Callable[[Exception], None] = None,
+                 interval: float = 15.0, stops_file: str = STOPS_FILE,
+                 fetcher: FeedFetcher = None, recorder=None, last_feed_file: str = None):
+        self.on_snapshot = on_snapshot
+        self.on_error = on_error
+        self.interval = interval
+        self.stops_file = stops_file
+        self.fetcher = fetcher  # the default one is built on the polling thread (importing requests is slow)
+        self.recorder = recorder  # optional feed_archive.FeedRecorder fed with every new payload
+        self.last_feed_file = last_feed_file
+
+        self.snapshot = None
+        self.last_poll = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='FeedPoller', daemon=True)
+
+    def start(self) -> 'FeedPoller':
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        if self.fetcher is not None:
+            self.fetcher.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def refresh_now(self) -> None:
+        """
+        Poll immediately instead of waiting out the rest of the interval.
+        """
+        self._wake.set()
+
+    @metrics.timed('poll')
+    def poll_once(self) -> typing.Optional[FeedSnapshot]:
+        """
+        Fetch once and build a snapshot if the feed changed.
+        Returns: the new FeedSnapshot, or None when the feed was unchanged
+        """
+        if self.fetcher is None:
+            self.fetcher = FeedFetcher(FEED_URL)
+        stops = cached_table(self.stops_file, load_stops)
+        feed, changed = self.fetcher.fetch()
+        self.last_poll = time.time()
+        if changed and self.recorder is not None:
+            self.recorder.append(self.fetcher.content, feed.header.timestamp)
+        if changed and self.last_feed_file:
+            self._save_last_feed(self.fetcher.content)
+        if not changed and self.snapshot is not None and self.snapshot.stops is stops:
+            return None
+
+        self.snapshot = FeedSnapshot.from_feed(feed, stops)
+        return self.snapshot
+
+    def restore(self) -> typing.Optional[FeedSnapshot]:
+        """
+        Snapshot of the feed the previous run saved to last_feed_file.
+        Returns: the FeedSnapshot, or None when there is no readable saved feed
+        """
+        from google.protobuf.message import DecodeError
+
+        if not self.last_feed_file:
+            return None
+        try:
+            with open(self.last_feed_file, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            return FeedSnapshot.from_bytes(data, cached_table(self.stops_file, load_stops))
+        except DecodeError:
+            return None
+
+    def _save_last_feed(self, data: bytes) -> None:
+        # temp file plus rename, so a crash mid-write never leaves a truncated feed behind
+        try:
+            os.makedirs(os.path.dirname(self.last_feed_file) or '.', exist_ok=True)
+            tmp = f'{self.last_feed_file}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.last_feed_file)
+        except OSError:
+            pass  # best effort, like the table cache
+
+    def _run(self) -> None:
+        try:
+            snapshot = self.restore()
+        except Exception as e:  # a bad saved feed must not stop the live polling
+            if self.on_error:
+                self.on_error(e)
+        else:
+            if snapshot is not None:
+                self.snapshot = snapshot
+                self.on_snapshot(snapshot)
+
+        while not self._stopped.is_set():
+            try:
+                snapshot = self.poll_once()
+            except Exception as e:  # network and parse errors must not kill the thread
+                if self.on_error:
+                    self.on_error(e)
+            else:
+                if snapshot is not None:
+                    self.on_snapshot(snapshot)
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
@@ -0,0 +1,182 @@
+"""
+Several GTFS-Realtime feeds (agencies, trip updates and alerts) behind one merged FeedSnapshot.
+
+Every feed has its own pooled FeedFetcher and all of them are fetched concurrently on a
+thread pool, so a refresh takes about as long as the slowest feed. stop_ids, trip_ids and
+parent_station codes are prefixed with the agency ("BART:M16-1") so agencies cannot collide.
+
+    python feed_registry.py feeds.json
+
+where feeds.json is a list of {"agency", "url", "stops_file", "kind"} objects
+(kind is "trip_updates", the default, or "alerts").
+"""
+import sys
+import json
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from google.transit import gtfs_realtime_pb2
+from bart_data import FEED_URL, STOPS_FILE, FeedFetcher, FeedSnapshot, load_stops
+from feed_decode import feed_rows
+from gtfs_static import cached_table
+from transit_model import Stop, StopTable
+import metrics
+
+ALERTS_URL = 'http://api.bart.gov/gtfsrt/alerts.aspx'
+SEPARATOR = ':'
+
+class FeedSource:
+    """
+    One feed to poll: the agency it belongs to, its URL and the stops.txt its stop_ids refer to.
+    """
+
+    def __init__(self, agency: str, url: str, stops_file: str = None, kind: str = 'trip_updates'):
+        if kind not in ('trip_updates', 'alerts'):
+            raise ValueError(f'unknown feed kind: {kind}')
+        self.agency = agency
+        self.url = url
+        self.stops_file = stops_file
+        self.kind = kind
+
+    @property
+    def name(self) -> str:
+        return f'{self.agency}/{self.kind}'
+
+DEFAULT_SOURCES = [FeedSource('BART', FEED_URL, STOPS_FILE),
+                   FeedSource('BART', ALERTS_URL, kind='alerts')]
+
+def namespaced(agency: str, value: str) -> str:
+    return f'{agency}{SEPARATOR}{value}' if value else value
+
+def namespace_stops(agency: str, stops: dict) -> StopTable:
+    """
+    Copy of a load_stops() table with stop_ids and parent_station codes prefixed by agency.
+    """
+    table = StopTable()
+    for sid, info in stops.items():
+        sid = namespaced(agency, sid)
+        table[sid] = Stop(sid, info.get('name', ''), code=info.get('code', ''),
+                          lat=info.get('lat'), lon=info.get('lon'), zone_id=info.get('zone_id', ''),
+                          parent_station=namespaced(agency, info.get('parent_station', '')),
+                          platform_code=info.get('platform_code', ''), location_type=info.get('location_type', ''))
+    return table
+
+class Alert:
+    """
+    One service alert with the stops, routes and trips it names (ids namespaced).
+    """
+    __slots__ = ('agency', 'alert_id', 'header', 'description', 'stop_ids', 'route_ids', 'trip_ids')
+
+    def __init__(self, agency: str, entity: gtfs_realtime_pb2.FeedEntity):
+        alert = entity.alert
+        self.agency = agency
+        self.alert_id = namespaced(agency, entity.id)
+        self.header = alert.header_text.translation[0].text if alert.header_text.translation else ''
+        self.description = alert.description_text.translation[0].text if alert.description_text.translation else ''
+        informed = alert.informed_entity
+        self.stop_ids = [namespaced(agency, e.stop_id) for e in informed if e.stop_id]
+        self.route_ids = [namespaced(agency, e.route_id) for e in informed if e.route_id]
+        self.trip_ids = [namespaced(agency, e.trip.trip_id) for e in informed if e.HasField('trip')]
+
+    def __repr__(self) -> str:
+        return f'Alert({self.alert_id!r}, {self.header!r})'
+
+class FeedRegistry:
+    """
+    Fetches every registered feed concurrently and merges the results into one FeedSnapshot.
+    A feed that fails keeps contributing its last good data; the error is kept in `errors`.
+    """
+
+    def __init__(self, sources: typing.Sequence[FeedSource] = DEFAULT_SOURCES, max_workers: int = None):
+        self.sources = list(sources)
+        self.fetchers = {src.name: FeedFetcher(src.url) for src in self.sources}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.sources) or 1,
+                                        thread_name_prefix='FeedRegistry')
+        self.rows = {}  # source name -> namespaced rows from its last good feed
+        self.timestamps = {}  # source name -> feed header timestamp
+        self.alerts = {}  # source name -> [Alert, ...]
+        self.errors = {}  # source name -> exception from the last refresh
+        self.durations = {}  # source name -> seconds the last fetch took
+        self.snapshot = None
+        self._stops = None
+        self._stops_key = None
+
+    def _fetch(self, src: FeedSource) -> typing.Tuple[gtfs_realtime_pb2.FeedMessage, bool]:
+        start = time.perf_counter()
+        try:
+            return self.fetchers[src.name].fetch()
+        finally:
+            self.durations[src.name] = time.perf_counter() - start
+
+    def stops(self) -> dict:
+        """
+        Merged, namespaced stops of every trip-update source, rebuilt only when a stops.txt changes.
+        """
+        tables = [(src.agency, cached_table(src.stops_file, load_stops))
+                  for src in self.sources if src.kind == 'trip_updates' and src.stops_file]
+        key = [(agency, id(table)) for agency, table in tables]
+        if key != self._stops_key:
+            merged = StopTable()
+            for agency, table in tables:
+                merged.update(namespace_stops(agency, table))
+            self._stops, self._stops_key = merged, key
+        return self._stops
+
+    def refresh(self) -> typing.Tuple[FeedSnapshot, bool]:
+        """
+        Fetch all feeds at once and rebuild the merged snapshot if any of them changed.
+        Returns: (snapshot, changed)
+        """
+        with metrics.timer('registry_refresh'):
+            futures = [(src, self._pool.submit(self._fetch, src)) for src in self.sources]
+            stops = self.stops()
+            changed = self.snapshot is None or self.snapshot.stops is not stops
+            for src, future in futures:
+                try:
+                    feed, feed_changed = future.result()
+                except Exception as e:  # one bad feed must not take down the others
+                    self.errors[src.name] = e
+                    continue
+                self.errors.pop(src.name, None)
+                if not feed_changed and src.name in self.timestamps:
+                    continue
+                changed = True
+                self.timestamps[src.name] = feed.header.timestamp
+                if src.kind == 'alerts':
+                    self.alerts[src.name] = [Alert(src.agency, ent) for ent in feed.entity if ent.HasField('alert')]
+                else:
+                    agency = src.agency + SEPARATOR
+                    self.rows[src.name] = [(agency + tid, agency + sid, arrival_time)
+                                           for tid, sid, arrival_time in feed_rows(feed)]
+
+            if changed:
+                rows = [row for src in self.sources for row in self.rows.get(src.name, ())]
+                self.snapshot = FeedSnapshot(stops, rows, max(self.timestamps.values(), default=0))
+        return self.snapshot, changed
+
+    def all_alerts(self) -> typing.List[Alert]:
+        return [alert for src in self.sources for alert in self.alerts.get(src.name, ())]
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+        for fetcher in self.fetchers.values():
+            fetcher.close()
+
+def load_sources(path: str) -> typing.List[FeedSource]:
+    """
+    Read feed definitions from a JSON list of {"agency", "url", "stops_file", "kind"} objects.
+    """
+    with open(path, encoding='utf-8') as f:
+        return [FeedSource(**entry) for entry in json.load(f)]
+
+if __name__ == "__main__":
+    registry = FeedRegistry(load_sources(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SOURCES)
+    start = time.perf_counter()
+    snapshot, _ = registry.refresh()
+    elapsed = time.perf_counter() - start
+    for src in registry.sources:
+        status = f"error: {registry.errors[src.name]}" if src.name in registry.errors else "ok"
+        print(f"{src.name}: {registry.durations.get(src.name, 0) * 1000:.0f} ms, {status}")
+    print(f"refresh: {elapsed * 1000:.0f} ms, {len(snapshot.trip_updates)} trips, "
+          f"{len(registry.all_alerts())} alerts")
+    registry.close()
@@ -0,0 +1,140 @@
+import os
+import pickle
+import hashlib
+import typing
+
+STATIC_DIR = 'google_transit_20250113-20250808_v10'
+CACHE_DIR  = 'cache'
+
+# Bump when the shape of any cached table changes so old pickles are ignored
+CACHE_VERSION = 5
+
+# (abs path, loader name, abs dependency paths) -> (fingerprint, digest, table)
+_memory_cache = {}
+
+def static_path(name: str, static_dir: str = STATIC_DIR) -> str:
+    """
+    Path of one file of the static GTFS feed, e.g. static_path('stops.txt').
+    """
+    return os.path.join(static_dir, name)
+
+def file_fingerprint(path: str) -> typing.Tuple[int, int]:
+    """
+    Cheap change detector for a source file.
+    Returns: (size, mtime_ns)
+    """
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def file_digest(path: str) -> str:
+    """
+    Content hash of a source file, used when the mtime moved but the bytes may not have
+    (e.g. after a fresh git checkout).
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def sources_fingerprint(paths: typing.Sequence[str]) -> tuple:
+    """
+    file_fingerprint of every source file of one table, in order.
+    """
+    return tuple(file_fingerprint(p) for p in paths)
+
+def sources_digest(paths: typing.Sequence[str]) -> str:
+    """
+    file_digest of a table's sources; a single file keeps its own digest.
+    """
+    if len(paths) == 1:
+        return file_digest(paths[0])
+    return hashlib.sha1(' '.join(file_digest(p) for p in paths).encode('ascii')).hexdigest()
+
+def _loader_name(loader: typing.Callable) -> str:
+    return f'{loader.__module__}.{loader.__qualname__}'
+
+def _cache_file(path: str, loader: typing.Callable, cache_dir: str, depends_on: typing.List[str] = ()) -> str:
+    # the basename keeps the cache readable; the hash of the full source paths keeps two feeds'
+    # stops.txt (or the same file with other dependencies) from sharing one pickle
+    sources = '\n'.join([os.path.abspath(path), *depends_on])
+    tag = hashlib.sha1(sources.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cache_dir, f'{os.path.basename(path)}.{_loader_name(loader)}.{tag}.pickle')
+
+def _read_cache(cache_file: str, path: str, loader: typing.Callable, depends_on: typing.List[str]) -> typing.Optional[dict]:
+    try:
+        with open(cache_file, 'rb') as f:
+            entry = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+    if (not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION
+            or entry.get('source') != os.path.abspath(path) or entry.get('loader') != _loader_name(loader)
+            or entry.get('depends_on', []) != depends_on):
+        return None
+    return entry
+
+def _write_cache(cache_file: str, entry: dict) -> None:
+    # Write to a temp file and rename so a crash never leaves a half-written cache
+    try:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        tmp = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass  # caching is best effort; a read-only checkout still works
+
+def cached_table(path: str, loader: typing.Callable[[str], typing.Any], cache_dir: str = CACHE_DIR,
+                 depends_on: typing.Sequence[str] = ()) -> typing.Any:
+    """
+    Return loader(path), parsing the source files only when one actually changed.
+    depends_on lists the other files the loader reads (e.g. fare_attributes.txt next to
+    fare_rules.txt); a change to any of them invalidates the table too.
+    Checks the in-process cache, then the on-disk pickle, and only then calls the loader.
+    A moved mtime with identical content (same sha1) still counts as a hit.
+    """
+    deps = [os.path.abspath(p) for p in depends_on]
+    key = (os.path.abspath(path), _loader_name(loader), tuple(deps))
+    sources = [path, *depends_on]
+    fingerprint = sources_fingerprint(sources)
+
+    hit = _memory_cache.get(key)
+    if hit and hit[0] == fingerprint:
+        return hit[2]
+
+    cache_file = _cache_file(path, loader, cache_dir, deps)
+    entry = hit and {'fingerprint': hit[0], 'digest': hit[1], 'table': hit[2]}
+    if entry is None:
+        entry = _read_cache(cache_file, path, loader, deps)
+
+    digest = None
+    if entry is not None and entry['fingerprint'] != fingerprint:
+        digest = sources_digest(sources)
+        if digest != entry['digest']:
+            entry = None
+        else:
+            # Same bytes, new mtime: refresh the stored fingerprint only
+            entry['fingerprint'] = fingerprint
+            _write_cache(cache_file, dict(entry, version=CACHE_VERSION,
+                                          source=key[0], loader=key[1], depends_on=deps))
+
+    if entry is None:
+        digest = digest or sources_digest(sources)
+        entry = {'fingerprint': fingerprint, 'digest': digest, 'table': loader(path)}
+        _write_cache(cache_file, dict(entry, version=CACHE_VERSION,
+                                      source=key[0], loader=key[1], depends_on=deps))
+
+    _memory_cache[key] = (entry['fingerprint'], entry['digest'], entry['table'])
+    return entry['table']
+
+def clear_cache(cache_dir: str = CACHE_DIR) -> None:
+    """
+    Drop the in-process cache and delete the on-disk pickles.
+    """
+    _memory_cache.clear()
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pickle'):
+            os.remove(os.path.join(cache_dir, name))
@@ -0,0 +1,167 @@
+import csv
+import typing
+import numpy as np
+from gtfs_static import STATIC_DIR, cached_table, static_path
+
+def parse_gtfs_time(value: str) -> int:
+    """
+    Convert a GTFS 'HH:MM:SS' time to seconds since the start of the service day.
+    Times past midnight keep counting (25:10:00 -> 90600). Empty times return -1.
+    """
+    if not value:
+        return -1
+    h, m, s = value.split(':')
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+def _intern(values: typing.List[str]) -> typing.Tuple[np.ndarray, typing.List[str], dict]:
+    """
+    Replace each string with a small integer code, in first-seen order.
+    Returns: (codes, code -> string list, string -> code dict)
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int32, count=len(values))
+    return codes, list(index), index
+
+def _offsets(codes: np.ndarray, n: int) -> np.ndarray:
+    """
+    Row offsets for a table sorted by codes: rows of code k are [offsets[k], offsets[k+1]).
+    """
+    offsets = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(np.bincount(codes, minlength=n), out=offsets[1:])
+    return offsets
+
+class StopTimes:
+    """
+    stop_times.txt as parallel NumPy columns, sorted by (trip, stop_sequence).
+    trip_ids/stop_ids are interned: trip[i] indexes trip_ids, stop[i] indexes stop_ids.
+    Times are seconds since the service day start (-1 when absent).
+    """
+
+    def __init__(self, trip_ids, trip_index, stop_ids, stop_index, trip, stop, stop_sequence, arrival, departure, dist):
+        self.trip_ids = trip_ids
+        self.trip_index = trip_index
+        self.stop_ids = stop_ids
+        self.stop_index = stop_index
+        self.trip = trip
+        self.stop = stop
+        self.stop_sequence = stop_sequence
+        self.arrival = arrival
+        self.departure = departure
+        self.dist = dist
+        self.trip_offsets = _offsets(trip, len(trip_ids))
+
+    def __len__(self) -> int:
+        return len(self.trip)
+
+    def trip_rows(self, trip_id: str) -> slice:
+        """
+        Row range of one trip, in stop_sequence order (empty if unknown).
+        """
+        code = self.trip_index.get(trip_id)
+        if code is None:
+            return slice(0, 0)
+        return slice(int(self.trip_offsets[code]), int(self.trip_offsets[code + 1]))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.trip, self.stop, self.stop_sequence, self.arrival,
+                                      self.departure, self.dist, self.trip_offsets))
+
+class Shapes:
+    """
+    shapes.txt as parallel NumPy columns, sorted by (shape, shape_pt_sequence).
+    shape[i] indexes shape_ids; rows of one shape are contiguous.
+    """
+
+    def __init__(self, shape_ids, shape_index, shape, lat, lon, dist):
+        self.shape_ids = shape_ids
+        self.shape_index = shape_index
+        self.shape = shape
+        self.lat = lat
+        self.lon = lon
+        self.dist = dist
+        self.shape_offsets = _offsets(shape, len(shape_ids))
+
+    def __len__(self) -> int:
+        return len(self.shape)
+
+    def shape_rows(self, shape_id: str) -> slice:
+        """
+        Row range of one shape, in point order (empty if unknown).
+        """
+        code = self.shape_index.get(shape_id)
+        if code is None:
+            return slice(0, 0)
+        return slice(int(self.shape_offsets[code]), int(self.shape_offsets[code + 1]))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.shape, self.lat, self.lon, self.dist, self.shape_offsets))
+
+def _read_columns(path: str, names: typing.List[typing.Union[str, tuple]]) -> typing.List[list]:
+    """
+    Read the named columns of a GTFS csv. A tuple names an optional column by its accepted
+    spellings; when none of them is present the column comes back as empty strings.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        idx = []
+        for name in names:
+            if isinstance(name, tuple):
+                idx.append(next((header.index(n) for n in name if n in header), None))
+            else:
+                idx.append(header.index(name))
+        columns = [[] for _ in names]
+        for row in reader:
+            for col, i in zip(columns, idx):
+                col.append(row[i] if i is not None else '')
+    return columns
+
+def _float_column(values: typing.List[str]) -> np.ndarray:
+    return np.array([float(v) if v else np.nan for v in values], dtype=np.float64)
+
+def load_stop_times(path: str = static_path('stop_times.txt')) -> StopTimes:
+    """
+    Parse stop_times.txt into a columnar StopTimes table.
+    """
+    trip_col, arr_col, dep_col, stop_col, seq_col, dist_col = _read_columns(
+        path, ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence',
+               ('shape_dist_traveled', 'shape_distance_traveled')])  # BART uses the non-standard name
+
+    trip, trip_ids, trip_index = _intern(trip_col)
+    stop, stop_ids, stop_index = _intern(stop_col)
+    stop_sequence = np.array(seq_col, dtype=np.int32)
+    arrival = np.fromiter(map(parse_gtfs_time, arr_col), dtype=np.int32, count=len(arr_col))
+    departure = np.fromiter(map(parse_gtfs_time, dep_col), dtype=np.int32, count=len(dep_col))
+    dist = _float_column(dist_col).astype(np.float32)
+
+    order = np.lexsort((stop_sequence, trip))
+    return StopTimes(trip_ids, trip_index, stop_ids, stop_index, trip[order], stop[order],
+                     stop_sequence[order], arrival[order], departure[order], dist[order])
+
+def load_shapes(path: str = static_path('shapes.txt')) -> Shapes:
+    """
+    Parse shapes.txt into a columnar Shapes table.
+    """
+    shape_col, lat_col, lon_col, seq_col, dist_col = _read_columns(
+        path, ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence',
+               ('shape_dist_traveled', 'shape_distance_traveled')])
+
+    shape, shape_ids, shape_index = _intern(shape_col)
+    seq = np.array(seq_col, dtype=np.int32)
+    order = np.lexsort((seq, shape))
+    return Shapes(shape_ids, shape_index, shape[order], _float_column(lat_col)[order],
+                  _float_column(lon_col)[order], _float_column(dist_col)[order])
+
+def stop_times(static_dir: str = STATIC_DIR) -> StopTimes:
+    """
+    Columnar stop_times.txt, parsed once and cached until the file changes.
+    """
+    return cached_table(static_path('stop_times.txt', static_dir), load_stop_times)
+
+def shapes(static_dir: str = STATIC_DIR) -> Shapes:
+    """
+    Columnar shapes.txt, parsed once and cached until the file changes.
+    """
+    return cached_table(static_path('shapes.txt', static_dir), load_shapes)
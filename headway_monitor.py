@@ -0,0 +1,141 @@
+import sys
+import heapq
+import bisect
+import typing
+from collections import defaultdict
+from bart_data import STOPS_FILE, FeedSnapshot, SnapshotDiff, diff_snapshots, load_stops
+from gtfs_static import cached_table
+
+BUNCH_SECONDS = 120  # trains this close together on one platform are bunched
+GAP_SECONDS = 1500  # a headway this long is a service gap (off-peak service runs every 20 min)
+EXPIRE_SECONDS = 60  # keep a prediction this long past its time, so a late drop-out still counts
+
+class HeadwayAlert:
+    """
+    A headway between two consecutive trains on one platform crossing a threshold.
+    kind is 'bunching', 'gap' or 'cleared' (a previously raised pair is back to normal or no longer adjacent).
+    """
+    __slots__ = ('kind', 'station', 'platform', 'leader', 'follower', 'headway')
+
+    def __init__(self, kind: str, station: str, platform: str, leader: str, follower: str, headway: int):
+        self.kind = kind
+        self.station = station
+        self.platform = platform
+        self.leader = leader
+        self.follower = follower
+        self.headway = headway
+
+    def __repr__(self) -> str:
+        return (f'HeadwayAlert({self.kind!r}, {self.station!r}, {self.platform!r}, '
+                f'{self.leader!r}, {self.follower!r}, {self.headway})')
+
+class HeadwayMonitor:
+    """
+    Keeps, per (parent_station, platform_code), the predicted arrivals in time order and
+    re-checks only the platforms a SnapshotDiff touched, so a poll costs O(changed predictions).
+    """
+
+    def __init__(self, stops: dict, bunch_seconds: int = BUNCH_SECONDS, gap_seconds: int = GAP_SECONDS):
+        self.stops = stops
+        self.bunch_seconds = bunch_seconds
+        self.gap_seconds = gap_seconds
+        self.rings = defaultdict(list)  # (station, platform) -> sorted [(time, trip_id), ...]
+        self.predictions = {}  # trip_id -> {stop_id: time}
+        self.alerts = {}  # (station, platform) -> {(leader, follower): HeadwayAlert} currently raised
+        self._expiry = []  # heap of (time, trip_id, stop_id); stale entries are skipped when popped
+
+    def _key(self, stop_id: str) -> typing.Tuple[str, str]:
+        stop = self.stops.get(stop_id, {})
+        return stop.get('parent_station') or stop_id, stop.get('platform_code', '')
+
+    def _insert(self, trip_id: str, stop_id: str, time: int, touched: set) -> None:
+        key = self._key(stop_id)
+        self.predictions.setdefault(trip_id, {})[stop_id] = time
+        bisect.insort(self.rings[key], (time, trip_id))
+        heapq.heappush(self._expiry, (time, trip_id, stop_id))
+        touched.add(key)
+
+    def _remove(self, trip_id: str, stop_id: str, touched: set) -> None:
+        time = self.predictions.get(trip_id, {}).pop(stop_id, None)
+        if time is None:
+            return
+        key = self._key(stop_id)
+        ring = self.rings[key]
+        i = bisect.bisect_left(ring, (time, trip_id))
+        if i < len(ring) and ring[i] == (time, trip_id):
+            del ring[i]
+        touched.add(key)
+
+    def update(self, diff: SnapshotDiff, snapshot: FeedSnapshot, now: float = None) -> typing.List[HeadwayAlert]:
+        """
+        Apply one poll's diff (diff_snapshots(previous, snapshot)) and return the alerts it raised or cleared.
+        """
+        touched = set()
+        for tid in diff.removed_trips:
+            for sid in list(self.predictions.get(tid, ())):
+                self._remove(tid, sid, touched)
+            self.predictions.pop(tid, None)
+        for tid in diff.added_trips:
+            for sid, arrival_time in snapshot.trip_updates.get(tid, ()):
+                if arrival_time:
+                    self._insert(tid, sid, arrival_time, touched)
+        for tid, sid, old_time, new_time in diff.changed_predictions:
+            self._remove(tid, sid, touched)
+            if new_time:
+                self._insert(tid, sid, new_time, touched)
+        self._expire(snapshot.timestamp if now is None else now, touched)
+
+        events = []
+        for key in touched:
+            events.extend(self._check(key))
+        return events
+
+    def _expire(self, now: float, touched: set) -> None:
+        # the heap yields predictions oldest first, so this only visits the expired ones
+        cutoff = now - EXPIRE_SECONDS
+        expiry = self._expiry
+        while expiry and expiry[0][0] < cutoff:
+            time, tid, sid = heapq.heappop(expiry)
+            if self.predictions.get(tid, {}).get(sid) == time:
+                self._remove(tid, sid, touched)
+
+    def _check(self, key: typing.Tuple[str, str]) -> typing.List[HeadwayAlert]:
+        ring = self.rings.get(key, ())
+        station, platform = key
+        current = {}
+        for (t0, leader), (t1, follower) in zip(ring, ring[1:]):
+            headway = t1 - t0
+            if headway <= self.bunch_seconds:
+                current[leader, follower] = HeadwayAlert('bunching', station, platform, leader, follower, headway)
+            elif headway >= self.gap_seconds:
+                current[leader, follower] = HeadwayAlert('gap', station, platform, leader, follower, headway)
+
+        raised = self.alerts.get(key, {})
+        events = [alert for pair, alert in current.items()
+                  if pair not in raised or raised[pair].kind != alert.kind]
+        events += [HeadwayAlert('cleared', station, platform, leader, follower, alert.headway)
+                   for (leader, follower), alert in raised.items() if (leader, follower) not in current]
+        if current:
+            self.alerts[key] = current
+        else:
+            self.alerts.pop(key, None)
+        return events
+
+    def active_alerts(self) -> typing.List[HeadwayAlert]:
+        return [alert for raised in self.alerts.values() for alert in raised.values()]
+
+if __name__ == "__main__":
+    # replay an archive through the monitor: python headway_monitor.py [archive directory]
+    from feed_archive import ARCHIVE_DIR, FeedReplay
+
+    replay = FeedReplay(sys.argv[1] if len(sys.argv) > 1 else ARCHIVE_DIR)
+    stops = cached_table(STOPS_FILE, load_stops)
+    monitor = HeadwayMonitor(stops)
+    previous = None
+    for snap in replay.snapshots(stops):
+        for alert in monitor.update(diff_snapshots(previous, snap), snap):
+            name = stops.get(alert.station, {}).get('name') or alert.station
+            print(f"{snap.timestamp} {alert.kind:9} {name} platform {alert.platform}: "
+                  f"{alert.leader} -> {alert.follower} {alert.headway // 60} min")
+        previous = snap
+    replay.close()
@@ -0,0 +1,95 @@
+"""
+Local HTTP stand-in for api.bart.gov, for running the app and FeedFetcher offline.
+Serves a saved feed (e.g. output/bart_feed.txt, converted to protobuf bytes) with
+ETag/Last-Modified, 304 Not Modified and gzip, like the real endpoint.
+
+    python local_feed_server.py output/bart_feed.txt --port 8765
+"""
+import os
+import gzip
+import typing
+import hashlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bart_data import load_feed_file
+
+DEFAULT_FEED_FILE = 'output/bart_feed.txt'
+
+class FeedServer(ThreadingHTTPServer):
+    """
+    Serves one feed payload at every path. Call set_feed() to publish a new one.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: typing.Tuple[str, int]):
+        super().__init__(address, FeedRequestHandler)
+        self.request_count = 0
+        self.set_feed(b'')
+
+    def set_feed(self, data: bytes, mtime: float = None) -> None:
+        self.payload = data
+        self.gzipped = gzip.compress(data)
+        self.etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        self.last_modified = formatdate(mtime, usegmt=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/gtfsrt/tripupdate.aspx'
+
+class FeedRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so pooled sessions reuse the socket
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def do_GET(self):
+        server = self.server
+        server.request_count += 1
+
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = server.payload
+        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if use_gzip:
+            body = server.gzipped
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('ETag', server.etag)
+        self.send_header('Last-Modified', server.last_modified)
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep test and benchmark output quiet
+
+def serve_feed(path: str = DEFAULT_FEED_FILE, host: str = '127.0.0.1', port: int = 0) -> FeedServer:
+    """
+    Start a FeedServer for a saved feed on a background thread.
+    port=0 picks a free port; the address is in server.url. Stop it with server.shutdown().
+    """
+    server = FeedServer((host, port))
+    server.set_feed(load_feed_file(path).SerializeToString(), os.path.getmtime(path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('feed_file', nargs='?', default=DEFAULT_FEED_FILE)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = FeedServer((args.host, args.port))
+    server.set_feed(load_feed_file(args.feed_file).SerializeToString(), os.path.getmtime(args.feed_file))
+    print(f"Serving {args.feed_file} at {server.url}")
+    server.serve_forever()
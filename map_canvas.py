@@ -0,0 +1,222 @@
+import csv
+import typing
+import tkinter
+import numpy as np
+from collections import defaultdict
+from gtfs_static import STATIC_DIR, static_path
+from gtfs_tables import Shapes
+
+MIN_ZOOM, MAX_ZOOM = 0, 10  # half-octave zoom steps
+SIMPLIFY_PIXELS = 1.0  # drop shape points closer than this to the simplified line
+STATION_RADIUS = 3
+TRAIN_RADIUS = 4
+DEFAULT_ROUTE_COLOR = '#888888'
+
+def load_route_colors(path: str = static_path('routes.txt')) -> dict:
+    """
+    Returns: {route_id: '#rrggbb'}
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['route_id']: '#' + row['route_color'] if row['route_color'] else DEFAULT_ROUTE_COLOR
+                for row in csv.DictReader(f)}
+
+def simplify(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker: indices of the points to keep so that no dropped point lies
+    further than `tolerance` from the simplified polyline. Always keeps both ends.
+    """
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[a + 1:b] - x[a], y[a + 1:b] - y[a]
+        length = np.hypot(dx, dy)
+        if length > 0:
+            dist = np.abs(dx * py - dy * px) / length
+        else:
+            dist = np.hypot(px, py)
+        i = int(dist.argmax())
+        if dist[i] > tolerance:
+            keep[a + 1 + i] = True
+            stack.append((a, a + 1 + i))
+            stack.append((a + 1 + i, b))
+    return np.flatnonzero(keep)
+
+class MapCanvas(tkinter.Canvas):
+    """
+    System map on a Tk canvas. Route polylines and station markers are created once and
+    only have their coordinates rewritten on zoom; train markers are moved with coords()
+    and only when they shift by at least a pixel.
+    """
+
+    def __init__(self, master, shapes: Shapes, stops: dict, trips: dict,
+                 static_dir: str = STATIC_DIR, **kwargs):
+        kwargs.setdefault('background', '#1c1c1c')
+        kwargs.setdefault('highlightthickness', 0)
+        super().__init__(master, **kwargs)
+        self.shapes = shapes
+        self.zoom = 0
+        self._simplified = {}  # (shape code, zoom) -> point indices
+        self._trains = {}  # trip_id -> (canvas item, x, y)
+        self._drawn = {}  # train canvas item -> (canvas x, canvas y) last drawn at
+
+        # equirectangular projection around the middle of the network, in metres
+        self._lat0 = float(np.nanmean(shapes.lat)) if len(shapes) else 0.0
+        self._lon0 = float(np.nanmean(shapes.lon)) if len(shapes) else 0.0
+        self._cos = np.cos(np.radians(self._lat0))
+        self._x, self._y = self.project(shapes.lat, shapes.lon)
+
+        self._stations = self._station_points(stops)
+        route_colors = load_route_colors(static_path('routes.txt', static_dir))
+        shape_color = {}
+        for trip in trips.values():
+            shape_color.setdefault(trip['shape_id'], route_colors.get(trip['route_id'], DEFAULT_ROUTE_COLOR))
+
+        self._lines = []
+        for code, shape_id in enumerate(shapes.shape_ids):
+            item = self.create_line(0, 0, 0, 0, fill=shape_color.get(shape_id, DEFAULT_ROUTE_COLOR),
+                                    width=2, tags=('route',))
+            self._lines.append(item)
+        self._station_items = []
+        for name, _, _ in self._stations:
+            item = self.create_oval(0, 0, 0, 0, fill='white', outline='', tags=('station',))
+            self._station_items.append(item)
+            self.tag_bind(item, '<Enter>', lambda e, n=name: self.itemconfig('hover', text=n))
+            self.tag_bind(item, '<Leave>', lambda e: self.itemconfig('hover', text=''))
+        self.create_text(10, 10, anchor='nw', fill='white', text='', tags=('hover',))
+
+        self.bind('<Configure>', lambda e: self._fit())
+        self.bind('<MouseWheel>', lambda e: self.zoom_by(1 if e.delta > 0 else -1))
+        self.bind('<Button-4>', lambda e: self.zoom_by(1))
+        self.bind('<Button-5>', lambda e: self.zoom_by(-1))
+        self.bind('<ButtonPress-1>', lambda e: self.scan_mark(e.x, e.y))
+        self.bind('<B1-Motion>', lambda e: self.scan_dragto(e.x, e.y, gain=1))
+        self._fit_scale = self._scale = 1.0
+        self._origin = (0.0, 0.0)
+
+    def project(self, lat, lon) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        lat/lon to map metres (x east, y south so it matches canvas orientation).
+        """
+        x = (np.asarray(lon) - self._lon0) * self._cos * 111320.0
+        y = (self._lat0 - np.asarray(lat)) * 110540.0
+        return x, y
+
+    def _station_points(self, stops: dict) -> typing.List[typing.Tuple[str, float, float]]:
+        # one marker per parent_station, at the mean of its platforms
+        platforms = defaultdict(list)
+        for stop in stops.values():
+            if stop.get('parent_station') and 'lat' in stop:
+                platforms[stop['parent_station']].append(stop)
+        points = []
+        for members in platforms.values():
+            x, y = self.project([s['lat'] for s in members], [s['lon'] for s in members])
+            points.append((members[0]['name'], float(x.mean()), float(y.mean())))
+        return points
+
+    def _to_canvas(self, x, y):
+        ox, oy = self._origin
+        return (np.asarray(x) - ox) * self._scale, (np.asarray(y) - oy) * self._scale
+
+    def _fit(self) -> None:
+        # zoom level 0 fits the whole network in the current window
+        width, height = max(self.winfo_width(), 1), max(self.winfo_height(), 1)
+        if not len(self._x):
+            return
+        span_x = float(np.nanmax(self._x) - np.nanmin(self._x)) or 1.0
+        span_y = float(np.nanmax(self._y) - np.nanmin(self._y)) or 1.0
+        fit_scale = 0.95 * min(width / span_x, height / span_y)
+        if fit_scale != self._fit_scale:
+            self._simplified.clear()  # tolerances are in pixels, so they depend on the scale
+            self._fit_scale = fit_scale
+        center = ((np.nanmax(self._x) + np.nanmin(self._x)) / 2, (np.nanmax(self._y) + np.nanmin(self._y)) / 2)
+        self._set_view(self.zoom, center)
+
+    def zoom_by(self, steps: int) -> None:
+        zoom = min(max(self.zoom + steps, MIN_ZOOM), MAX_ZOOM)
+        if zoom == self.zoom:
+            return
+        # keep the point under the middle of the visible area in place
+        cx = self.canvasx(self.winfo_width() / 2) / self._scale + self._origin[0]
+        cy = self.canvasy(self.winfo_height() / 2) / self._scale + self._origin[1]
+        self.xview_moveto(0)
+        self.yview_moveto(0)
+        self._set_view(zoom, (cx, cy))
+
+    def _set_view(self, zoom: int, center: typing.Tuple[float, float]) -> None:
+        self.zoom = zoom
+        self._scale = self._fit_scale * 2 ** (zoom / 2)
+        width, height = self.winfo_width(), self.winfo_height()
+        self._origin = (center[0] - width / 2 / self._scale, center[1] - height / 2 / self._scale)
+        self._redraw_static()
+        self._move_trains(force=True)
+
+    def _redraw_static(self) -> None:
+        sh = self.shapes
+        tolerance = SIMPLIFY_PIXELS / self._scale
+        cx, cy = self._to_canvas(self._x, self._y)
+        for code, item in enumerate(self._lines):
+            points = slice(int(sh.shape_offsets[code]), int(sh.shape_offsets[code + 1]))
+            key = (code, self.zoom)
+            if key not in self._simplified:
+                self._simplified[key] = simplify(self._x[points], self._y[points], tolerance)
+            keep = self._simplified[key] + points.start
+            if len(keep) >= 2:
+                self.coords(item, *np.column_stack((cx[keep], cy[keep])).ravel().tolist())
+
+        r = STATION_RADIUS
+        for (_, x, y), item in zip(self._stations, self._station_items):
+            (px,), (py,) = self._to_canvas([x], [y])
+            self.coords(item, px - r, py - r, px + r, py + r)
+        self.tag_raise('station')
+        self.tag_raise('train')
+        self.tag_raise('hover')
+
+    def update_trains(self, trip_ids: typing.Sequence[str], lat: np.ndarray, lon: np.ndarray,
+                      active: np.ndarray = None) -> None:
+        """
+        Move train markers to new positions (e.g. from PositionEngine.positions), creating
+        and deleting markers only for trains that appeared or finished.
+        """
+        x, y = self.project(lat, lon)
+        if active is None:
+            active = np.ones(len(trip_ids), dtype=bool)
+        seen = set()
+        for tid, tx, ty, live in zip(trip_ids, x.tolist(), y.tolist(), active.tolist()):
+            if not live:
+                continue
+            seen.add(tid)
+            if tid in self._trains:
+                item, _, _ = self._trains[tid]
+                self._trains[tid] = (item, tx, ty)
+            else:
+                item = self.create_oval(0, 0, 0, 0, fill='#ff4040', outline='black', tags=('train',))
+                self.tag_bind(item, '<Enter>', lambda e, t=tid: self.itemconfig('hover', text=f"Train {t}"))
+                self.tag_bind(item, '<Leave>', lambda e: self.itemconfig('hover', text=''))
+                self._trains[tid] = (item, tx, ty)
+        for tid in set(self._trains) - seen:
+            item = self._trains.pop(tid)[0]
+            self._drawn.pop(item, None)
+            self.delete(item)
+        self._move_trains()
+
+    def _move_trains(self, force: bool = False) -> None:
+        if not self._trains:
+            return
+        items, xs, ys = zip(*self._trains.values())
+        px, py = self._to_canvas(xs, ys)
+        r = TRAIN_RADIUS
+        drawn = self._drawn
+        for item, x, y in zip(items, px.tolist(), py.tolist()):
+            last = drawn.get(item)
+            if not force and last is not None and abs(last[0] - x) < 1 and abs(last[1] - y) < 1:
+                continue  # under a pixel: leave the item alone
+            drawn[item] = (x, y)
+            self.coords(item, x - r, y - r, x + r, y + r)
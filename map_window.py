@@ -1,61 +1,222 @@
+import time
+startTime = time.perf_counter()  # time-to-first-window is measured from here
+import queue
 import datetime
 import tkinter
-import sv_ttk
+import metrics
 from datetime import datetime
 from tkinter import ttk
-from bart_data import get_train_schedule, get_stop_arrivals, refresh_data, get_all_stops
+from bart_data import STOPS_FILE, TRIPS_FILE, diff_snapshots, load_stops, load_trips
+from feed_poller import LAST_FEED_FILE, FeedPoller
+from arrival_board import ArrivalBoard
+from gtfs_static import cached_table
+from station_search import station_index
+# numpy and the map modules are imported by mapBtnClick, sv_ttk just before the theme is set,
+# and requests/protobuf on the poller thread, so none of them delay the first window
 
-STOPS_FILE = 'google_transit_20250113-20250808_v10/stops.txt'
-FEED_URL   = 'http://api.bart.gov/gtfsrt/tripupdate.aspx'
+POLL_INTERVAL = 15.0  # seconds between background feed polls
+MAP_FRAME_MS = 100  # train marker animation interval while the map is showing
 
-# Load stops and fetch the feed
-stops, feed, nextByTrain, allStops = refresh_data(STOPS_FILE, FEED_URL)  # process the feed and stops
+# Filled in when the background poller delivers its first snapshot
+snapshot = None
+board = None
+stops = {}
+nextByTrain = {}
+allStops = {}
 prevFunction = None
+prevView = None  # ('trains',), ('stops',), ('train', trainId), ('stop', stopName) or ('map',)
+lastError = None
+lastBoardTick = 0.0
+shownText = None
+mapCanvas = None  # built the first time the map view is opened
+positions = None
 
-def showOutput(text, currentFunction = prevFunction):
+# Prepared snapshots and errors travel from the poller thread to the Tk thread through this queue
+snapshotQueue = queue.Queue()
+preparedSnapshot = None  # last snapshot prepareSnapshot handled; only the poller thread uses it
+
+def showOutput(text, currentFunction = prevFunction, currentView = None):
     # display output in the text box
-    outputBox.config(state='normal')  # Make it editable
-    outputBox.delete(1.0, 'end')  # Clear previous content
-    outputBox.insert('end', text)  # Insert new content
-    outputBox.config(state='disabled')  # Make it read-only again
+    global shownText
+    showTextView()
+    if text != shownText:  # skip the delete/insert (and the flicker) when nothing changed
+        with metrics.timer('tk_redraw'):
+            outputBox.config(state='normal')  # Make it editable
+            outputBox.delete(1.0, 'end')  # Clear previous content
+            outputBox.insert('end', text)  # Insert new content
+            outputBox.config(state='disabled')  # Make it read-only again
+        shownText = text
     
     # update prevFunction global var
-    global prevFunction
+    global prevFunction, prevView
     prevFunction = currentFunction
+    prevView = currentView
+
+def showTextView():
+    if mapCanvas is not None and mapCanvas.winfo_ismapped():
+        mapCanvas.pack_forget()
+        outputBox.pack(padx=10, pady=10, fill='both', expand=True)
+
+def mapBtnClick():
+    # swap the text box for the map canvas; static layers are drawn once, trains animate
+    global mapCanvas, positions, prevFunction, prevView
+    print("Showing map...")
+    if mapCanvas is None:
+        from gtfs_tables import shapes, stop_times
+        from map_canvas import MapCanvas
+        from train_positions import PositionEngine
+        staticStops = stops or cached_table(STOPS_FILE, load_stops)
+        trips = cached_table(TRIPS_FILE, load_trips)
+        mapCanvas = MapCanvas(outputFrame, shapes(), staticStops, trips)
+        positions = PositionEngine(stop_times(), shapes(), staticStops, trips)
+        if snapshot is not None:
+            positions.load(snapshot)
+    if not mapCanvas.winfo_ismapped():
+        outputBox.pack_forget()
+        mapCanvas.pack(padx=10, pady=10, fill='both', expand=True)
+        prevFunction, prevView = None, ('map',)
+        root.after(0, animateMap)
+
+def animateMap():
+    # move the train markers while the map is on screen
+    if mapCanvas is None or not mapCanvas.winfo_ismapped():
+        return
+    if positions.trip_ids:
+        with metrics.timer('map_frame'):
+            lat, lon, active = positions.positions(time.time())
+            mapCanvas.update_trains(positions.trip_ids, lat, lon, active)
+    root.after(MAP_FRAME_MS, animateMap)
+
+@metrics.timed('prepare_snapshot')
+def prepareSnapshot(newSnapshot):
+    # runs on the poller thread: build everything derived from the snapshot (diff, arrival
+    # table and board, train list, map knots) so the Tk thread only swaps references
+    global preparedSnapshot
+    diff = diff_snapshots(preparedSnapshot, newSnapshot)
+    preparedSnapshot = newSnapshot
+    newBoard = ArrivalBoard(newSnapshot)
+    engine = positions  # the map may be opened later; applySnapshot then loads it itself
+    knots = engine.prepare(newSnapshot) if engine is not None else None
+    snapshotQueue.put(('snapshot', (newSnapshot, diff, newBoard, newSnapshot.next_by_train(), engine, knots)))
+
+@metrics.timed('tk_apply_snapshot')
+def applySnapshot(prepared):
+    # swap in a snapshot prepared by the poller thread and update everything that shows it
+    global snapshot, board, stops, nextByTrain, allStops
+    newSnapshot, diff, newBoard, newNextByTrain, engine, knots = prepared
+    if snapshot is None:
+        print(f"First data after {(time.perf_counter() - startTime) * 1000:.0f} ms.")
+    stopsChanged = set(newSnapshot.all_stops) != set(allStops)
+    snapshot = newSnapshot
+    board = newBoard
+    stops = snapshot.stops
+    nextByTrain = newNextByTrain
+    allStops = snapshot.all_stops
+    if positions is not None:
+        if engine is positions:
+            positions.apply(knots)
+        else:
+            positions.load(snapshot)
+    print(f"Loaded {len(stops)} stops and {len(nextByTrain)} trains "
+          f"(+{len(diff.added_trips)} -{len(diff.removed_trips)} trips, {len(diff.changed_predictions)} changed predictions).\n")
+
+    # only touch the widgets whose content actually changed
+    if diff.added_trips or diff.removed_trips:
+        trainDropdown.config(values=[f"see train: {trainId}" for trainId in sorted(nextByTrain.keys())])
+    if stopsChanged:
+        # keep whatever filter is being typed into the stop box
+        stopDropdown.config(values=stopChoices(stopDropdown.get()))
+    if prevFunction and viewAffected(prevView, diff):
+        prevFunction()
+
+def viewAffected(view, diff):
+    # does the diff touch what the output box currently shows?
+    if not diff:
+        return False
+    if view is None:
+        return True
+    if view[0] == 'train':
+        return view[1] in diff.added_trips or view[1] in diff.removed_trips or view[1] in diff.changed_trips
+    if view[0] == 'stop':
+        return view[1] in diff.affected_stations
+    if view[0] == 'map':
+        return False  # the map animates itself
+    return True
+
+def checkSnapshots():
+    # runs on the Tk thread: drain the poller queue, then update the data age label
+    global lastError
+    while True:
+        try:
+            kind, payload = snapshotQueue.get_nowait()
+        except queue.Empty:
+            break
+        if kind == 'snapshot':
+            # each diff is against the snapshot before it, so apply them all in order
+            applySnapshot(payload)
+            lastError = None
+        else:
+            lastError = payload
+    tickBoard()
+
+    if snapshot is None:
+        status = "Waiting for first feed..."
+    else:
+        status = f"Data age: {int(time.time() - snapshot.timestamp)} s"
+    if lastError is not None:
+        status += f" (last refresh failed: {lastError})"
+    statusLabel.config(text=status)
+    root.after(500, checkSnapshots)
+
+def tickBoard():
+    # re-render an open station board once a second from the in-memory index, no feed access
+    global lastBoardTick
+    now = time.time()
+    if prevView and prevView[0] == 'stop' and now - lastBoardTick >= 1.0:
+        lastBoardTick = now
+        prevFunction()
 
 def refreshBtnClick():
     print("Refreshing data...")
-    global stops, feed, nextByTrain, allStops
-    stops, feed, nextByTrain, allStops = refresh_data(STOPS_FILE, FEED_URL)  # Refresh the data
-    print("Data refreshed successfully.")
-    print(f"Loaded {len(stops)} stops and {len(nextByTrain)} trains.\n")
-    prevFunction()
+    poller.refresh_now()  # the new snapshot arrives through checkSnapshots
+
+def waitingForData():
+    if snapshot is None:
+        showOutput("Waiting for the first feed to arrive...")
+        return True
+    return False
 
 def listTrainsBtnClick():
     print("Listing Trains...")
+    if waitingForData():
+        return
     output = "Train List:\n"
 
-    for trainId, (stopId, minutes) in sorted(nextByTrain.items()):
+    for trainId, (stopId, minutes) in sorted(snapshot.next_by_train().items()):
         stopName = stops.get(stopId, {}).get('name', 'Unknown')
         output += f"Train {trainId} → {stopName} ({stopId}) in {minutes} min\n"
 
-    showOutput(output, listTrainsBtnClick)
+    showOutput(output, listTrainsBtnClick, ('trains',))
 
 def listStopsBtnClick():
     print("Listing Stops...")
+    if waitingForData():
+        return
     output = "Stop List:\n"
 
-    listOfStops = get_all_stops(feed, stops)
+    listOfStops = snapshot.all_stops
     
     for stopName in sorted(listOfStops):
         parentStation = listOfStops[stopName]['parent_station']
         stopId = listOfStops[stopName]['stop_id']
         output += f"{stopName} ({stopId}) - Parent Station: {parentStation}\n"
     
-    showOutput(output, listStopsBtnClick)
+    showOutput(output, listStopsBtnClick, ('stops',))
 
 def byTrainBtnClick(trainId):
-    schedule = get_train_schedule(feed, stops, trainId)  # Example train ID
+    if waitingForData():
+        return
+    schedule = snapshot.train_schedule(trainId)
 
     output = f'Schedule for trip ID {trainId} as of {datetime.now().strftime("%I:%M %p")}: \n'
     if not schedule:
@@ -64,19 +225,47 @@ def byTrainBtnClick(trainId):
         for stopName, stopId, minutes in schedule:
             output += f"{stopId} ({stopName}) in {minutes} min\n"
 
-    showOutput(output, lambda: byTrainBtnClick(trainId))
+    showOutput(output, lambda: byTrainBtnClick(trainId), ('train', trainId))
 
 def byStopBtnClick(stopName):
-    arrivals = get_stop_arrivals(feed, stops, stopName)  # Example stop ID
+    if waitingForData():
+        return
+    arrivals = board.minutes_until(stopName, n=None)
 
     output = f'Arrivals for {stopName} as of {datetime.now().strftime("%I:%M %p")}:\n'
     if not arrivals:
         output += f"No arrivals found for stop {stopName}."
     else:
-        for trainId, minutes, stopId, stopName in arrivals:
+        for trainId, minutes, stopId in arrivals:
             output += f"Train {trainId} at {stopName} ({stopId}) in {minutes} min\n"
     
-    showOutput(output, lambda: byStopBtnClick(stopName))
+    showOutput(output, lambda: byStopBtnClick(stopName), ('stop', stopName))
+
+def stopSearchIndex():
+    # built once per stops table, so filtering while typing never rescans the stops
+    return station_index(stops or cached_table(STOPS_FILE, load_stops))
+
+def stopChoices(text):
+    # dropdown entries for what is in the stop box: search matches while typing, else every stop
+    if text and not text.startswith("see stop: "):
+        return [f"see stop: {station.name}" for station in stopSearchIndex().search(text, limit=20)]
+    return [f"see stop: {stopId}" for stopId in sorted(allStops)]
+
+def filterStops(event):
+    # narrow the stop dropdown to the stations matching what has been typed so far
+    if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+        return
+    stopDropdown.config(values=stopChoices(stopDropdown.get()))
+
+def seeStopClick():
+    # the dropdown holds a picked "see stop: <name>" entry or whatever was typed ("embarc", "LAKE")
+    text = stopDropdown.get()
+    query = text.split(': ', 1)[1] if text.startswith("see stop: ") else text
+    if query not in allStops:
+        station = stopSearchIndex().resolve(query)
+        if station is not None:
+            query = station.name
+    byStopBtnClick(query)
 
 def createButtons(buttonsFrame, buttonsList):
     # refresh
@@ -100,13 +289,20 @@ def createButtons(buttonsFrame, buttonsList):
     # create train and stop dropdowns
     createDropdowns(buttonsFrame, buttonsList)  # Create dropdowns and their buttons
 
+    # map
+    mapButton = ttk.Button(buttonsFrame, text="map")
+    mapButton.config(command=lambda: mapBtnClick())
+    mapButton.grid(row=8, column=0, padx=5, pady=9, sticky='ew')
+    buttonsList.append(mapButton)
+
     # exit
     exitButton = ttk.Button(buttonsFrame, text="exit")
     exitButton.config(command=lambda: root.quit())
-    exitButton.grid(row=8, column=0, padx=5, pady=9, sticky='ew')
+    exitButton.grid(row=9, column=0, padx=5, pady=9, sticky='ew')
     buttonsList.append(exitButton)
 
 def createDropdowns(buttonsFrame, buttonsList):
+    global trainDropdown, stopDropdown
     # Create see train button
     trainList = [f"see train: {trainId}" for trainId in sorted(nextByTrain.keys())]
     trainDropdown = ttk.Combobox(buttonsFrame, values=trainList, state='readonly')
@@ -118,9 +314,11 @@ def createDropdowns(buttonsFrame, buttonsList):
 
     # create see stop button
     stopList = [f"see stop: {stopId}" for stopId in sorted(allStops)]
-    stopDropdown = ttk.Combobox(buttonsFrame, values=stopList, state='readonly')
+    stopDropdown = ttk.Combobox(buttonsFrame, values=stopList)  # editable: typing filters the list
+    stopDropdown.bind('<KeyRelease>', filterStops)
+    stopDropdown.bind('<Return>', lambda event: seeStopClick())
     stopDropdown.grid(row=len(buttonsList)+1, column=0, padx=5, pady=9, sticky='ew')  # Place stop dropdown in grid
-    selectStopButton = ttk.Button(buttonsFrame, text="see stop", command=lambda: byStopBtnClick(stopDropdown.get().split(': ')[1]))
+    selectStopButton = ttk.Button(buttonsFrame, text="see stop", command=lambda: seeStopClick())
     selectStopButton.grid(row=len(buttonsList)+2, column=0, padx=5, pady=9, sticky='ew')  # Place stop button in grid
     buttonsList.append(stopDropdown)
     buttonsList.append(selectStopButton)
@@ -148,11 +346,34 @@ if __name__ == "__main__":
     label = ttk.Label(outputFrame, text="Output: ")
     label.pack(padx=10, pady=5)
 
+    statusLabel = ttk.Label(outputFrame, text="Waiting for first feed...")
+    statusLabel.pack(padx=10, pady=0)
+
     global outputBox  # Make outputBox accessible in onClick
     outputBox = tkinter.Text(outputFrame, width=100, height=50)
     outputBox.pack(padx=10, pady=10, fill='both', expand=True)
     outputBox.config(state='disabled')  # Make it read-only
 
     # Set the theme
+    import sv_ttk
     sv_ttk.set_theme("dark")
-    root.mainloop()
\ No newline at end of file
+
+    # Paint the window before any data work starts
+    root.update()
+    firstWindow = time.perf_counter() - startTime
+    metrics.observe('first_window', firstWindow)
+    print(f"First window after {firstWindow * 1000:.0f} ms.")
+
+    # Poll the feed in the background; the window is usable before the first snapshot lands.
+    # The poller starts with the feed saved by the last run, then fetches a fresh one.
+    poller = FeedPoller(on_snapshot=prepareSnapshot,
+                        on_error=lambda e: snapshotQueue.put(('error', e)),
+                        interval=POLL_INTERVAL, stops_file=STOPS_FILE, last_feed_file=LAST_FEED_FILE)
+    poller.start()
+    root.after(0, checkSnapshots)
+
+    # BART_METRICS=1 prints a per-stage timing line every minute
+    metricsLogger = metrics.MetricsLogger(60.0).start() if metrics.ENABLED else None
+
+    root.mainloop()
+    poller.stop(timeout=1)
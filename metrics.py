@@ -0,0 +1,197 @@
+"""
+In-process instrumentation: per-stage timers, counters and latency histograms.
+
+Off unless BART_METRICS=1 is set or enable() is called; while off, timer() hands back
+a shared no-op context manager and count()/observe() return after one flag check.
+
+    with metrics.timer('parse'):
+        feed.ParseFromString(data)
+    metrics.count('feed_bytes', len(data))
+    print(metrics.prometheus_text())
+"""
+import os
+import time
+import bisect
+import typing
+import functools
+import threading
+
+ENABLED = os.environ.get('BART_METRICS', '') not in ('', '0')
+
+# Upper bounds in seconds, from sub-millisecond index queries up to slow HTTP fetches
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}  # name -> value
+_histograms = {}  # stage name -> Histogram
+
+def enable(on: bool = True) -> None:
+    global ENABLED
+    ENABLED = on
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram (Prometheus semantics) plus sum, count and max.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th observation, capped at the largest value seen.
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+def observe(stage: str, seconds: float) -> None:
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = Histogram()
+        hist.observe(seconds)
+
+def count(name: str, value: int = 1) -> None:
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+class _Timer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.stage, time.perf_counter() - self.start)
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullTimer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+def timer(stage: str) -> typing.ContextManager:
+    """
+    Context manager recording the block's wall time under `stage`.
+    """
+    return _Timer(stage) if ENABLED else _NULL_TIMER
+
+def timed(stage: str) -> typing.Callable:
+    """
+    Decorator recording every call's wall time under `stage`.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def snapshot() -> dict:
+    """
+    Copy of the current values.
+    Returns: {'counters': {name: value}, 'stages': {stage: {count, sum, max, p50, p99}}}
+    """
+    with _lock:
+        return {'counters': dict(_counters),
+                'stages': {stage: {'count': h.count, 'sum': h.sum, 'max': h.max,
+                                   'p50': h.quantile(0.5), 'p99': h.quantile(0.99)}
+                           for stage, h in _histograms.items()}}
+
+def prometheus_text(prefix: str = 'bart_') -> str:
+    """
+    Everything recorded so far in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            lines.append(f'# TYPE {prefix}{name}_total counter')
+            lines.append(f'{prefix}{name}_total {value}')
+        if _histograms:
+            name = f'{prefix}stage_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for stage, h in sorted(_histograms.items()):
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+    return '\n'.join(lines) + '\n'
+
+def log_line() -> str:
+    """
+    One-line summary: count, p50 and max per stage in milliseconds, then the counters.
+    """
+    data = snapshot()
+    parts = [f"{stage} n={s['count']} p50={s['p50'] * 1000:.2f}ms max={s['max'] * 1000:.2f}ms"
+             for stage, s in sorted(data['stages'].items())]
+    parts += [f'{name}={value}' for name, value in sorted(data['counters'].items())]
+    return 'metrics: ' + '; '.join(parts)
+
+class MetricsLogger:
+    """
+    Writes log_line() every `interval` seconds from a daemon thread.
+    """
+
+    def __init__(self, interval: float = 60.0, write: typing.Callable[[str], None] = print):
+        self.interval = interval
+        self.write = write
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='MetricsLogger', daemon=True)
+
+    def start(self) -> 'MetricsLogger':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.write(log_line())
@@ -0,0 +1,132 @@
+import os
+import csv
+import typing
+import numpy as np
+from datetime import date as Date, datetime, timedelta
+from gtfs_static import STATIC_DIR, cached_table, static_path
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+def _parse_date(value: str) -> Date:
+    return datetime.strptime(value, '%Y%m%d').date()
+
+class ServiceCalendar:
+    """
+    calendar.txt and calendar_dates.txt resolved for every date in the feed's validity range.
+    services[d] is a packed bitset of the service_ids running on first_day + d, and
+    trips[d] the packed bitset of trips.txt trips they cover, so membership tests are O(1).
+    """
+
+    def __init__(self, first_day: Date, service_ids: typing.List[str], trip_ids: typing.List[str],
+                 trip_service: np.ndarray, services: np.ndarray, trips: np.ndarray):
+        self.first_day = first_day
+        self.service_ids = service_ids
+        self.service_index = {s: i for i, s in enumerate(service_ids)}
+        self.trip_ids = trip_ids
+        self.trip_index = {t: i for i, t in enumerate(trip_ids)}
+        self.trip_service = trip_service
+        self.services = services
+        self.trips = trips
+        self._active_trips = {}
+
+    def __len__(self) -> int:
+        return len(self.services)
+
+    @property
+    def last_day(self) -> Date:
+        return self.first_day + timedelta(days=len(self.services) - 1)
+
+    def _day(self, day: Date) -> int:
+        d = (day - self.first_day).days
+        return d if 0 <= d < len(self.services) else -1
+
+    @staticmethod
+    def _bit(bits: np.ndarray, i: int) -> bool:
+        return bool(bits[i >> 3] & (0x80 >> (i & 7)))  # np.packbits is big-endian within a byte
+
+    def is_service_active(self, service_id: str, day: Date) -> bool:
+        d, s = self._day(day), self.service_index.get(service_id)
+        return d >= 0 and s is not None and self._bit(self.services[d], s)
+
+    def is_running(self, trip_id: str, day: Date) -> bool:
+        """
+        Does a trips.txt trip run on this service day? False outside the feed's validity range.
+        """
+        d, t = self._day(day), self.trip_index.get(trip_id)
+        return d >= 0 and t is not None and self._bit(self.trips[d], t)
+
+    def service_mask(self, day: Date) -> np.ndarray:
+        """
+        Bool per service code: running on this day (all False outside the validity range).
+        """
+        d = self._day(day)
+        if d < 0:
+            return np.zeros(len(self.service_ids), dtype=bool)
+        return np.unpackbits(self.services[d], count=len(self.service_ids)).astype(bool)
+
+    def active_service_ids(self, day: Date) -> set:
+        return {self.service_ids[i] for i in np.flatnonzero(self.service_mask(day))}
+
+    def active_trips(self, day: Date) -> typing.FrozenSet[str]:
+        """
+        trip_ids running on this service day, built once per date.
+        """
+        if day not in self._active_trips:
+            d = self._day(day)
+            if d < 0:
+                running = frozenset()
+            else:
+                mask = np.unpackbits(self.trips[d], count=len(self.trip_ids)).astype(bool)
+                running = frozenset(self.trip_ids[i] for i in np.flatnonzero(mask))
+            self._active_trips[day] = running
+        return self._active_trips[day]
+
+def _read_rows(path: str) -> typing.List[dict]:
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def load_calendar(path: str = static_path('calendar.txt')) -> ServiceCalendar:
+    """
+    Resolve calendar.txt with the calendar_dates.txt exceptions and trips.txt
+    (read from the same directory) into per-date service and trip bitsets.
+    """
+    directory = os.path.dirname(path)
+    calendar = _read_rows(path)
+    exceptions = _read_rows(os.path.join(directory, 'calendar_dates.txt'))
+    trip_rows = _read_rows(os.path.join(directory, 'trips.txt'))
+
+    service_ids = sorted({r['service_id'] for r in calendar} | {r['service_id'] for r in exceptions}
+                         | {r['service_id'] for r in trip_rows})
+    service_index = {s: i for i, s in enumerate(service_ids)}
+    days = [_parse_date(r['start_date']) for r in calendar] + [_parse_date(r['end_date']) for r in calendar]
+    days += [_parse_date(r['date']) for r in exceptions]
+    if not days:
+        first_day, n_days = Date.today(), 0
+    else:
+        first_day = min(days)
+        n_days = (max(days) - first_day).days + 1
+
+    # weekday patterns: one column per service, one row per date
+    active = np.zeros((n_days, len(service_ids)), dtype=bool)
+    weekday = (np.arange(n_days) + first_day.weekday()) % 7
+    for r in calendar:
+        start = (_parse_date(r['start_date']) - first_day).days
+        end = (_parse_date(r['end_date']) - first_day).days + 1
+        runs = np.array([r[w] == '1' for w in WEEKDAYS])
+        active[start:end, service_index[r['service_id']]] = runs[weekday[start:end]]
+    for r in exceptions:
+        active[(_parse_date(r['date']) - first_day).days, service_index[r['service_id']]] = r['exception_type'] == '1'
+
+    trip_ids = [r['trip_id'] for r in trip_rows]
+    trip_service = np.array([service_index[r['service_id']] for r in trip_rows], dtype=np.int32)
+    trips = np.packbits(active[:, trip_service], axis=1)
+    return ServiceCalendar(first_day, service_ids, trip_ids, trip_service, np.packbits(active, axis=1), trips)
+
+def service_calendar(static_dir: str = STATIC_DIR) -> ServiceCalendar:
+    """
+    The resolved service calendar, built once and cached until calendar.txt, calendar_dates.txt
+    or trips.txt changes.
+    """
+    return cached_table(static_path('calendar.txt', static_dir), load_calendar,
+                        depends_on=[static_path('calendar_dates.txt', static_dir),
+                                    static_path('trips.txt', static_dir)])
@@ -0,0 +1,202 @@
+"""
+Station lookup by name, station code or stop code, tolerant of partial and misspelt input.
+
+    index = station_index(stops)
+    index.search('embarc')   # [Station('EMBR', 'Embarcadero', ['EMBR', 'M16-1', 'M16-2'])]
+    index.resolve('12th')    # Station('12TH', '12th Street / Oakland City Center', [...])
+    index.match('e')         # None: too many stations start with "e" to pick one
+
+Prefix matches come from one sorted term list (a bisect finds the range of terms sharing
+the prefix); input with no prefix match falls back to trigram similarity over the names.
+search() and resolve() always offer their best guess, for pickers; match() only answers
+when the query identifies one station, for lookups that must not return the wrong one.
+"""
+import re
+import sys
+import bisect
+import typing
+from transit_model import StopTable
+
+MIN_SIMILARITY = 0.3  # trigram overlap below this is not offered as a match
+STOP_TYPES = ('', '0', '1')  # GTFS location_type of platforms and stations; entrances are not indexed
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+def normalize(text: str) -> str:
+    """
+    Lower case with every run of punctuation and spaces turned into one space.
+    """
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+def trigrams(text: str) -> typing.Set[str]:
+    padded = f'  {normalize(text)} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Station:
+    """
+    One parent station and every platform (stop_id) under it.
+    """
+    __slots__ = ('code', 'name', 'stop_ids', 'names')
+
+    def __init__(self, code: str, name: str, stop_ids: typing.List[str], names: typing.List[str]):
+        self.code = code
+        self.name = name  # the station row's stop_name, else its first platform's
+        self.stop_ids = stop_ids
+        self.names = names  # every distinct stop_name used by the station's platforms
+
+    def __repr__(self) -> str:
+        return f'Station({self.code!r}, {self.name!r}, {self.stop_ids!r})'
+
+class StationIndex:
+    """
+    Search index over the stations of one load_stops() table, built once per table.
+    Searchable terms are the names and each word in them, the parent_station and zone_id
+    codes ("EMBR", "LAKE"), stop_codes ("902101") and stop_ids ("A10-1").
+    """
+
+    def __init__(self, stops: dict):
+        groups = {}  # station code -> [stop_id, ...], station row first
+        for sid, stop in stops.items():
+            if stop.get('location_type', '') not in STOP_TYPES:
+                continue
+            code = stop.get('parent_station') or sid
+            group = groups.setdefault(code, [])
+            if sid == code:
+                group.insert(0, sid)
+            else:
+                group.append(sid)
+
+        self.stations = []
+        self.by_code = {}
+        self.by_stop_id = {}
+        terms = {}  # normalized term -> {station position, ...}
+        self._grams = {}  # trigram -> {name position, ...}
+        self._gram_names = []  # name position -> (station position, trigram count)
+        for code, stop_ids in groups.items():
+            names = list(dict.fromkeys(stops[sid].get('name', '') for sid in stop_ids))
+            station = Station(code, names[0], stop_ids, names)
+            pos = len(self.stations)
+            self.stations.append(station)
+            self.by_code[code] = station
+            for sid in stop_ids:
+                self.by_stop_id[sid] = station
+
+            keys = {code, *names}
+            for sid in stop_ids:
+                stop = stops[sid]
+                keys.update((sid, stop.get('code', ''), stop.get('zone_id', '')))
+            for key in keys:
+                text = normalize(key)
+                if not text:
+                    continue
+                terms.setdefault(sys.intern(text), set()).add(pos)
+                for word in text.split(' ')[1:]:
+                    terms.setdefault(sys.intern(word), set()).add(pos)
+
+            for name in names:
+                grams = trigrams(name)
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(len(self._gram_names))
+                self._gram_names.append((pos, len(grams)))
+
+        # sorted parallel lists: terms[i] is matched by the stations in _owners[i]
+        self.terms = sorted(terms)
+        self._owners = [tuple(sorted(terms[term])) for term in self.terms]
+        self.by_name = {name: station for station in self.stations for name in station.names}
+
+    def _prefix(self, text: str) -> typing.Dict[int, int]:
+        """
+        Stations with a term starting with `text`, scored 2 for an exact term and 1 for a prefix.
+        """
+        found = {}
+        lo = bisect.bisect_left(self.terms, text)
+        hi = bisect.bisect_left(self.terms, text + '\x7f', lo)
+        for i in range(lo, hi):
+            score = 2 if self.terms[i] == text else 1
+            for pos in self._owners[i]:
+                if found.get(pos, 0) < score:
+                    found[pos] = score
+        return found
+
+    def _fuzzy(self, text: str) -> typing.Dict[int, float]:
+        """
+        Stations whose names share enough trigrams with `text` (Jaccard similarity).
+        """
+        grams = trigrams(text)
+        shared = {}
+        for gram in grams:
+            for name_pos in self._grams.get(gram, ()):
+                shared[name_pos] = shared.get(name_pos, 0) + 1
+        found = {}
+        for name_pos, n in shared.items():
+            pos, count = self._gram_names[name_pos]
+            similarity = n / (len(grams) + count - n)
+            if similarity >= MIN_SIMILARITY and similarity > found.get(pos, 0):
+                found[pos] = similarity
+        return found
+
+    def search(self, query: str, limit: int = 10) -> typing.List[Station]:
+        """
+        Best matching stations, best first: exact terms, then prefixes of every query word,
+        then (only when nothing matched by prefix) trigram similarity.
+        """
+        text = normalize(query)
+        if not text:
+            return []
+
+        words = text.split(' ')
+        scores = self._prefix(text)
+        if len(words) > 1:
+            # every word must prefix some term of the station ("12th oak", "walnut cr")
+            common = None
+            for word in words:
+                hits = self._prefix(word)
+                common = hits if common is None else {pos: common[pos] + hits[pos] for pos in common if pos in hits}
+            for pos, score in common.items():
+                scores[pos] = max(scores.get(pos, 0), score / len(words))
+        if not scores:
+            scores = self._fuzzy(text)
+
+        ranked = sorted(scores, key=lambda pos: (-scores[pos], self.stations[pos].name))
+        return [self.stations[pos] for pos in ranked[:limit]]
+
+    def _exact(self, query: str) -> typing.Optional[Station]:
+        return self.by_code.get(query) or self.by_name.get(query) or self.by_stop_id.get(query)
+
+    def resolve(self, query: str) -> typing.Optional[Station]:
+        """
+        The single best station for a query, or None when nothing is close.
+        """
+        station = self._exact(query)
+        if station is not None:
+            return station
+        matches = self.search(query, limit=1)
+        return matches[0] if matches else None
+
+    def match(self, query: str) -> typing.Optional[Station]:
+        """
+        The station a query unambiguously names: an exact stop_name, station code or stop_id,
+        else the only station with a term equal to (or, failing that, starting with) the
+        normalized query. None otherwise; there is no similarity fallback.
+        """
+        station = self._exact(query)
+        if station is not None:
+            return station
+        text = normalize(query)
+        if not text:
+            return None
+        scores = self._prefix(text)
+        exact = [pos for pos, score in scores.items() if score == 2]
+        candidates = exact or list(scores)
+        return self.stations[candidates[0]] if len(candidates) == 1 else None
+
+def station_index(stops: dict) -> StationIndex:
+    """
+    The StationIndex of a stops table. A StopTable keeps its index, so it is built once per
+    table and freed with it; any other mapping gets a fresh index each call.
+    """
+    if not isinstance(stops, StopTable):
+        return StationIndex(stops)
+    if stops.station_index is None:
+        stops.station_index = StationIndex(stops)
+    return stops.station_index
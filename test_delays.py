@@ -0,0 +1,35 @@
+from datetime import date
+import numpy as np
+from bart_data import FeedSnapshot, STOPS_FILE, load_stops
+from delays import DelayEngine, service_day_start
+from gtfs_tables import stop_times
+
+TRIP = '1682368'  # calls at Y10-1 twice (sequences 26 and 27) on the SFO loop
+DELAY = 120
+
+def _late_trip(engine):
+    table = engine.stop_times
+    rows = table.trip_rows(TRIP)
+    day_start = service_day_start(date(2025, 3, 4), engine.tz)
+    stop_ids = [table.stop_ids[s] for s in table.stop[rows]]
+    predicted = [day_start + int(t) + DELAY for t in table.arrival[rows]]
+    return stop_ids, table.stop_sequence[rows], predicted, day_start
+
+def test_repeated_stop_matches_its_own_call():
+    engine = DelayEngine(stop_times())
+    stop_ids, _, predicted, day_start = _late_trip(engine)
+    assert stop_ids.count('Y10-1') == 2
+    snapshot = FeedSnapshot(load_stops(STOPS_FILE), [(TRIP, sid, t) for sid, t in zip(stop_ids, predicted)],
+                            day_start + 86000)
+    result = engine.compute_snapshot(snapshot)
+    assert len(result.delay) == len(stop_ids)
+    assert (result.delay == DELAY).all()
+
+def test_stop_sequence_join():
+    engine = DelayEngine(stop_times())
+    stop_ids, sequence, predicted, day_start = _late_trip(engine)
+    trips, stops = engine.encode([TRIP] * len(stop_ids), stop_ids)
+    # reversed feed order: only the stop_sequence tells the two Y10-1 calls apart
+    result = engine.compute(trips[::-1], stops[::-1], np.array(predicted)[::-1], day_start + 86000,
+                            sequence=np.asarray(sequence)[::-1])
+    assert (result.delay == DELAY).all()
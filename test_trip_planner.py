@@ -0,0 +1,16 @@
+from datetime import datetime
+from trip_planner import TripPlanner
+
+def test_boards_at_origin_instead_of_riding_back():
+    planner = TripPlanner()
+    journey = planner.plan('Embarcadero', 'Fremont', datetime(2025, 3, 4, 8, 0, tzinfo=planner.tz))
+    # trip 1682928 calls at Embarcadero (M16-2) at 08:12; riding to Montgomery first to catch it gains nothing
+    assert journey.transfers == 0
+    assert journey.legs[0][:3] == ('1682928', 'M16-2', 8 * 3600 + 12 * 60)
+    assert journey.arrival == 32280
+
+def test_late_train_from_previous_day():
+    planner = TripPlanner()
+    journey = planner.plan('EMBR', 'Millbrae', datetime(2025, 3, 6, 0, 30, tzinfo=planner.tz))
+    assert journey.day.isoformat() == '2025-03-05'
+    assert journey.legs[0][2] == 24 * 3600 + 39 * 60
@@ -0,0 +1,150 @@
+import typing
+import numpy as np
+from bart_data import FeedSnapshot
+from gtfs_tables import Shapes, StopTimes
+
+class PositionEngine:
+    """
+    Places every active train on its shape by interpolating between realtime stop ETAs.
+    Build once per static feed; load() each new snapshot; positions() is cheap enough
+    to call at animation rates for all trains at once. load() is prepare() plus apply():
+    prepare() only reads the static tables, so it can run on a worker thread while
+    positions() keeps serving the previous snapshot.
+    """
+
+    def __init__(self, stop_times: StopTimes, shapes: Shapes, stops: dict, trips: dict):
+        self.stop_times = stop_times
+        self.shapes = shapes
+
+        # shape code of every static trip (-1 when it has none)
+        self.trip_shape = np.array([shapes.shape_index.get(trips.get(tid, {}).get('shape_id'), -1)
+                                    for tid in stop_times.trip_ids], dtype=np.int64)
+
+        # shape points as one sorted key space: shape code * span + distance along the shape
+        self._span = float(np.nanmax(shapes.dist)) + 1.0 if len(shapes) else 1.0
+        self._shape_keys = shapes.shape * self._span + shapes.dist
+
+        self.stop_dist = self._project_stops(stops)
+        self.trip_ids: typing.List[str] = []
+        self._knot_times = np.empty(0)
+        self._knot_dist = np.empty(0)
+        self._knot_offsets = np.zeros(1, dtype=np.int64)
+        self._shape = np.empty(0, dtype=np.int64)
+
+    def _project_stops(self, stops: dict) -> np.ndarray:
+        """
+        Distance along each trip's shape of every stop_times row, from the nearest shape point.
+        (shape_distance_traveled in stop_times.txt is partly blank and not in shapes.txt units.)
+        """
+        st, sh = self.stop_times, self.shapes
+        lat = np.array([stops.get(sid, {}).get('lat', np.nan) for sid in st.stop_ids])
+        lon = np.array([stops.get(sid, {}).get('lon', np.nan) for sid in st.stop_ids])
+        row_shape = self.trip_shape[st.trip]
+
+        dist = np.full(len(st), np.nan)
+        for code in np.unique(row_shape[row_shape >= 0]):
+            rows = np.flatnonzero(row_shape == code)
+            pairs, inverse = np.unique(st.stop[rows], return_inverse=True)
+            points = slice(int(sh.shape_offsets[code]), int(sh.shape_offsets[code + 1]))
+            scale = np.cos(np.radians(sh.lat[points].mean()))
+            d2 = ((lat[pairs, None] - sh.lat[None, points]) ** 2
+                  + ((lon[pairs, None] - sh.lon[None, points]) * scale) ** 2)
+            dist[rows] = sh.dist[points][d2.argmin(axis=1)][inverse]
+        return dist
+
+    def load(self, snapshot: FeedSnapshot) -> None:
+        """
+        Turn a snapshot's predictions into knots and use them from now on.
+        """
+        self.apply(self.prepare(snapshot))
+
+    def prepare(self, snapshot: FeedSnapshot) -> tuple:
+        """
+        Turn a snapshot's predictions into per-train (time, distance) knots: the scheduled
+        departure from the previous stop, then every predicted arrival.
+        Returns: the knot state for apply()
+        """
+        st = self.stop_times
+        trip_ids, shape, knot_times, knot_dist, offsets = [], [], [], [], [0]
+        for tid, updates in snapshot.trip_updates.items():
+            code = st.trip_index.get(tid)
+            if code is None or self.trip_shape[code] < 0:
+                continue
+            rows = st.trip_rows(tid)
+            row_stop = st.stop[rows]
+            times, dists = [], []
+            for sid, arrival_time in updates:
+                hit = np.flatnonzero(row_stop == st.stop_index.get(sid, -1))
+                if not arrival_time or not len(hit):
+                    continue
+                i = rows.start + int(hit[0])
+                if not times and i > rows.start:
+                    # back off to the previous stop by the scheduled running time
+                    run = int(st.arrival[i]) - int(st.departure[i - 1])
+                    if st.arrival[i] >= 0 and st.departure[i - 1] >= 0:
+                        times.append(arrival_time - run)
+                        dists.append(self.stop_dist[i - 1])
+                if times and arrival_time < times[-1]:
+                    continue
+                times.append(arrival_time)
+                dists.append(self.stop_dist[i])
+            if not times:
+                continue
+            if len(times) == 1:
+                times.append(times[0])
+                dists.append(dists[0])
+            trip_ids.append(tid)
+            shape.append(self.trip_shape[code])
+            knot_times.extend(times)
+            knot_dist.extend(dists)
+            offsets.append(len(knot_times))
+
+        offsets = np.array(offsets, dtype=np.int64)
+        knot_times = np.array(knot_times, dtype=np.float64)
+        # knots as one sorted key space: train rank * span + seconds since the first knot
+        t0 = knot_times.min() if len(knot_times) else 0.0
+        tspan = knot_times.max() - t0 + 1.0 if len(knot_times) else 1.0
+        rank = np.repeat(np.arange(len(trip_ids)), np.diff(offsets))
+        return (trip_ids, np.array(shape, dtype=np.int64), offsets, knot_times,
+                np.array(knot_dist, dtype=np.float64), t0, tspan, rank * tspan + (knot_times - t0))
+
+    def apply(self, state: tuple) -> None:
+        """
+        Switch positions() to knots built by prepare().
+        """
+        (self.trip_ids, self._shape, self._knot_offsets, self._knot_times, self._knot_dist,
+         self._t0, self._tspan, self._knot_keys) = state
+
+    def _interpolate(self, keys: np.ndarray, x: np.ndarray, base: np.ndarray, local: np.ndarray,
+                     lo: np.ndarray, hi: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Locate base + local in a sorted key space of groups laid out as base + x, where each
+        group owns rows [lo, hi). Returns the upper row i of the bracketing pair (i - 1, i)
+        and the fraction of the way from x[i - 1] to x[i].
+        """
+        i = np.clip(np.searchsorted(keys, base + local, side='right'), lo + 1, hi - 1)
+        width = x[i] - x[i - 1]
+        frac = np.divide(local - x[i - 1], width, out=np.ones_like(width), where=width > 0)
+        return i, np.clip(frac, 0.0, 1.0)
+
+    def positions(self, now: float) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Interpolated position of every loaded train at epoch `now`. Trains sit at their
+        first stop before departing and at their last predicted stop after arriving.
+        Returns: (lat, lon, active) parallel to self.trip_ids; active = not yet past the last stop
+        """
+        n = len(self.trip_ids)
+        if not n:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool)
+        lo, hi = self._knot_offsets[:-1], self._knot_offsets[1:]
+        elapsed = np.full(n, min(max(now - self._t0, 0.0), self._tspan - 1.0))
+        i, frac = self._interpolate(self._knot_keys, self._knot_times - self._t0,
+                                    np.arange(n) * self._tspan, elapsed, lo, hi)
+        dist = self._knot_dist[i - 1] + frac * (self._knot_dist[i] - self._knot_dist[i - 1])
+
+        sh = self.shapes
+        j, frac = self._interpolate(self._shape_keys, sh.dist, self._shape * self._span, dist,
+                                    sh.shape_offsets[self._shape], sh.shape_offsets[self._shape + 1])
+        lat = sh.lat[j - 1] + frac * (sh.lat[j] - sh.lat[j - 1])
+        lon = sh.lon[j - 1] + frac * (sh.lon[j] - sh.lon[j - 1])
+        return lat, lon, now <= self._knot_times[hi - 1]
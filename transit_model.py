@@ -0,0 +1,157 @@
+import sys
+import array
+import bisect
+import typing
+import itertools
+from collections.abc import Mapping
+
+class Stop(Mapping):
+    """
+    One stops.txt row with its strings interned, so the many repeated names, zone_ids and
+    parent_station codes share storage. Behaves like the read-only dict load_stops used to
+    return (stop['name'], stop.get('platform_code'), dict(stop)), so callers need no changes.
+    """
+    __slots__ = ('stop_id', 'name', 'code', 'lat', 'lon', 'zone_id', 'parent_station', 'platform_code',
+                 'location_type')
+
+    def __init__(self, stop_id: str, name: str, code: str = '', lat: float = None, lon: float = None,
+                 zone_id: str = '', parent_station: str = '', platform_code: str = '', location_type: str = ''):
+        intern = sys.intern
+        self.stop_id = intern(stop_id)
+        self.name = intern(name)
+        self.code = intern(code)
+        self.lat = lat
+        self.lon = lon
+        self.zone_id = intern(zone_id)
+        self.parent_station = intern(parent_station)
+        self.platform_code = intern(platform_code)
+        self.location_type = intern(location_type)  # '' or '0' platform, '1' station, '2' entrance
+
+    # --- read-only mapping adapter ---
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)  # a stop without coordinates has no 'lat'/'lon' key
+        return value
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return (key for key in self.__slots__ if getattr(self, key) is not None)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f'Stop({self.stop_id!r}, {self.name!r}, parent_station={self.parent_station!r})'
+
+    def __reduce__(self):
+        return Stop, tuple(getattr(self, key) for key in self.__slots__)
+
+class StopTable(dict):
+    """
+    {stop_id: Stop} with the stop_name -> [stop_id, ...] and stop_id -> station code indexes
+    built once per table instead of once per feed refresh.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ids_by_name = None
+        self._station_codes = None
+        self.station_index = None  # station_search.StationIndex, built on first search
+
+    @property
+    def ids_by_name(self) -> typing.Dict[str, typing.List[str]]:
+        if self._ids_by_name is None:
+            self._ids_by_name = _ids_by_name(self)
+        return self._ids_by_name
+
+    @property
+    def station_codes(self) -> typing.Dict[str, str]:
+        if self._station_codes is None:
+            self._station_codes = _station_codes(self)
+        return self._station_codes
+
+def _ids_by_name(stops: dict) -> typing.Dict[str, typing.List[str]]:
+    index = {}
+    for stop_id, stop in stops.items():
+        index.setdefault(stop.get('name'), []).append(stop_id)
+    return index
+
+def stop_ids_by_name(stops: dict) -> typing.Dict[str, typing.List[str]]:
+    """
+    stop_name -> [stop_id, ...] for any stops mapping; cached when it is a StopTable.
+    """
+    return stops.ids_by_name if isinstance(stops, StopTable) else _ids_by_name(stops)
+
+def _station_codes(stops: dict) -> typing.Dict[str, str]:
+    return {stop_id: stop.get('parent_station') or stop_id for stop_id, stop in stops.items()}
+
+def station_codes(stops: dict) -> typing.Dict[str, str]:
+    """
+    stop_id -> code of the station it belongs to (its parent_station, else itself), for any
+    stops mapping; cached when it is a StopTable.
+    """
+    return stops.station_codes if isinstance(stops, StopTable) else _station_codes(stops)
+
+class Arrival(typing.NamedTuple):
+    """
+    One upcoming train at a station, as returned by FeedSnapshot.stop_arrivals.
+    """
+    train_id: str
+    minutes: int
+    stop_id: str
+    stop_name: str
+
+class ArrivalTable:
+    """
+    Every timed prediction of a snapshot as struct-of-arrays columns, grouped by station
+    and sorted by (arrival time, trip_id, stop_id) within each group.
+    spans[code] = (lo, hi) is the row range of one station (see station_codes) across all
+    its platforms, whatever their stop_names.
+    trip_ids and stop_ids hold references to the feed's own strings, so a row costs
+    8 bytes of time plus two pointers instead of a tuple.
+    """
+    __slots__ = ('times', 'trip_ids', 'stop_ids', 'spans')
+
+    def __init__(self, rows: typing.Sequence[typing.Tuple[str, str, int]], stops: dict):
+        # sort per station as short-lived tuples, then keep only the flat columns
+        buckets = {}
+        get = station_codes(stops).get
+        for tid, sid, arrival_time in rows:
+            if arrival_time:
+                code = get(sid)
+                if code is not None:
+                    bucket = buckets.get(code)
+                    if bucket is None:
+                        bucket = buckets[code] = []
+                    bucket.append((arrival_time, tid, sid))
+        spans, lo = {}, 0
+        for code, bucket in buckets.items():
+            bucket.sort()
+            spans[code] = (lo, lo + len(bucket))
+            lo += len(bucket)
+        flat = list(itertools.chain.from_iterable(buckets.values()))
+
+        self.times = array.array('q', [entry[0] for entry in flat])
+        self.trip_ids = [entry[1] for entry in flat]
+        self.stop_ids = [entry[2] for entry in flat]
+        self.spans = spans
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def first_after(self, code: str, now: float) -> typing.Tuple[int, int]:
+        """
+        Row range of a station's arrivals at or after `now` ((0, 0) for an unknown station).
+        """
+        lo, hi = self.spans.get(code, (0, 0))
+        return bisect.bisect_left(self.times, now, lo, hi), hi
+
+    def entries(self, code: str) -> typing.List[typing.Tuple[int, str, str]]:
+        """
+        A station's arrivals as the (arrival_time, trip_id, stop_id) tuples older code expects.
+        """
+        lo, hi = self.spans.get(code, (0, 0))
+        return list(zip(self.times[lo:hi], self.trip_ids[lo:hi], self.stop_ids[lo:hi]))
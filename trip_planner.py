@@ -0,0 +1,260 @@
+import csv
+import typing
+import numpy as np
+from datetime import date as Date, datetime, timedelta
+from collections import defaultdict
+from bart_data import STOPS_FILE, load_stops
+from delays import DelayEngine, load_agency_timezone, service_day_start
+from gtfs_static import STATIC_DIR, cached_table, static_path
+from gtfs_tables import StopTimes, stop_times
+from service_calendar import ServiceCalendar, service_calendar
+
+# Walking time between two platforms of one station when transfers.txt does not list the pair
+DEFAULT_TRANSFER_SECONDS = 120
+
+def load_transfers(path: str = static_path('transfers.txt')) -> dict:
+    """
+    Minimum transfer time per (from_stop_id, to_stop_id). Route-specific rows are folded
+    into the shortest time listed for the stop pair.
+    Returns: {(from_stop_id, to_stop_id): seconds}
+    """
+    transfers = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            pair = (row['from_stop_id'], row['to_stop_id'])
+            seconds = int(row['min_transfer_time'] or 0)
+            transfers[pair] = min(seconds, transfers.get(pair, seconds))
+    return transfers
+
+class Journey:
+    """
+    An earliest-arrival journey: legs of (trip_id, from_stop_id, departure, to_stop_id, arrival),
+    with times as seconds since the start of service day `day` (past 24:00 for late trains).
+    """
+
+    def __init__(self, legs: typing.List[typing.Tuple[str, str, int, str, int]], day: Date = None,
+                 day_start: int = 0):
+        self.legs = legs
+        self.day = day
+        self.day_start = day_start  # epoch seconds of the service day start
+
+    @property
+    def departure(self) -> int:
+        return self.legs[0][2]
+
+    @property
+    def arrival(self) -> int:
+        return self.legs[-1][4]
+
+    @property
+    def transfers(self) -> int:
+        return len(self.legs) - 1
+
+    @property
+    def arrival_epoch(self) -> int:
+        return self.day_start + self.arrival
+
+    def __repr__(self) -> str:
+        return f'Journey({self.legs!r}, day={self.day!r})'
+
+class Timetable:
+    """
+    Connections for one service day, sorted by departure time, plus a footpath table
+    between platforms of the same parent_station. Build once per day (and per realtime overlay).
+    """
+
+    def __init__(self, table: StopTimes, stops: dict, calendar: ServiceCalendar, day: Date,
+                 transfers: dict, static_dir: str = STATIC_DIR, trip_delays: dict = None):
+        self.table = table
+        self.stops = stops
+        self.day = day
+        self.day_start = service_day_start(day, load_agency_timezone(static_path('agency.txt', static_dir)))
+
+        # trips running that day
+        running = np.array([calendar.is_running(tid, day) for tid in table.trip_ids], dtype=bool)
+
+        # a connection is a hop between consecutive rows of one trip
+        same_trip = table.trip[:-1] == table.trip[1:]
+        timed = (table.departure[:-1] >= 0) & (table.arrival[1:] >= 0)
+        hop = np.flatnonzero(same_trip & timed & running[table.trip[:-1]])
+
+        dep_time = table.departure[hop].astype(np.int32)
+        arr_time = table.arrival[hop + 1].astype(np.int32)
+        trip = table.trip[hop]
+        if trip_delays:
+            # realtime overlay: shift every connection of a delayed trip by its current delay
+            shift = np.zeros(len(table.trip_ids), dtype=np.int32)
+            for tid, delay in trip_delays.items():
+                code = table.trip_index.get(tid)
+                if code is not None:
+                    shift[code] = int(delay)
+            dep_time = dep_time + shift[trip]
+            arr_time = arr_time + shift[trip]
+
+        order = np.lexsort((arr_time, dep_time))
+        self.dep_stop = table.stop[hop][order]
+        self.arr_stop = table.stop[hop + 1][order]
+        self.dep_time = dep_time[order]
+        self.arr_time = arr_time[order]
+        self.trip = trip[order]
+
+        self.footpaths = self._footpaths(transfers)
+
+    def _footpaths(self, transfers: dict) -> typing.List[typing.List[typing.Tuple[int, int]]]:
+        """
+        Per stop code: [(other stop code, seconds), ...] for the other platforms of its station.
+        """
+        stop_ids = self.table.stop_ids
+        by_station = defaultdict(list)
+        for code, sid in enumerate(stop_ids):
+            by_station[self.stops.get(sid, {}).get('parent_station') or sid].append(code)
+
+        footpaths = [[] for _ in stop_ids]
+        for codes in by_station.values():
+            for a in codes:
+                for b in codes:
+                    if a != b:
+                        seconds = transfers.get((stop_ids[a], stop_ids[b]), DEFAULT_TRANSFER_SECONDS)
+                        footpaths[a].append((b, seconds))
+        return footpaths
+
+    def station_stops(self, station: str) -> typing.List[int]:
+        """
+        Stop codes of every platform of a station, given its parent_station code, a stop_id or the
+        stop_name of the station or any of its platforms (the station row itself has no stop_times).
+        """
+        stations = {stop.get('parent_station') or sid for sid, stop in self.stops.items()
+                    if sid == station or stop.get('parent_station') == station or stop.get('name') == station}
+        return [code for code, sid in enumerate(self.table.stop_ids)
+                if (self.stops.get(sid, {}).get('parent_station') or sid) in stations]
+
+    def earliest_arrival(self, origin: str, destination: str, depart: int) -> typing.Optional[Journey]:
+        """
+        Connection scan from origin to destination leaving at or after `depart`
+        (seconds since the service day start). Returns None when unreachable that day.
+        """
+        sources = self.station_stops(origin)
+        targets = self.station_stops(destination)
+        if not sources or not targets:
+            raise ValueError(f'unknown station: {origin if not sources else destination}')
+
+        inf = np.iinfo(np.int32).max
+        n_stops = len(self.table.stop_ids)
+        earliest = [inf] * n_stops
+        # trips ridden to get there at that time; equal arrivals prefer fewer
+        legs_to = [inf] * n_stops
+        # how each stop was reached: (boarding connection, alighting connection) or a footpath
+        reached_by = [None] * n_stops
+        for s in sources:
+            earliest[s] = depart
+            legs_to[s] = 0
+        # trip code -> (boarding connection, legs before boarding): the latest stop the trip
+        # could be boarded at without more transfers, so no journey rides out and back
+        boarded = {}
+        target_set = set(targets)
+        best = inf
+
+        dep_stop, arr_stop = self.dep_stop, self.arr_stop
+        dep_time, arr_time, trip = self.dep_time.tolist(), self.arr_time.tolist(), self.trip
+        start = int(np.searchsorted(self.dep_time, depart))
+        for c in range(start, len(dep_time)):
+            t_dep = dep_time[c]
+            if t_dep >= best:
+                break  # no later connection can improve the answer
+            tr = int(trip[c])
+            here = int(dep_stop[c])
+            board = boarded.get(tr)
+            if earliest[here] <= t_dep and (board is None or legs_to[here] <= board[1]):
+                board = boarded[tr] = (c, legs_to[here])
+            elif board is None:
+                continue
+            t_arr = arr_time[c]
+            s = int(arr_stop[c])
+            legs = board[1] + 1
+            if t_arr < earliest[s] or (t_arr == earliest[s] and legs < legs_to[s]):
+                earliest[s] = t_arr
+                legs_to[s] = legs
+                reached_by[s] = ('trip', board[0], c)
+                if s in target_set:
+                    best = min(best, t_arr)
+                for other, seconds in self.footpaths[s]:
+                    t_walk = t_arr + seconds
+                    if t_walk < earliest[other] or (t_walk == earliest[other] and legs < legs_to[other]):
+                        earliest[other] = t_walk
+                        legs_to[other] = legs
+                        reached_by[other] = ('walk', s)
+                        if other in target_set:
+                            best = min(best, t_walk)
+
+        if best == inf:
+            return None
+        end = min(targets, key=lambda s: (earliest[s], legs_to[s]))
+        return Journey(self._legs(end, reached_by), self.day, self.day_start)
+
+    def _legs(self, stop: int, reached_by: list) -> typing.List[typing.Tuple[str, str, int, str, int]]:
+        legs = []
+        stop_ids, trip_ids = self.table.stop_ids, self.table.trip_ids
+        while reached_by[stop] is not None:
+            how = reached_by[stop]
+            if how[0] == 'walk':
+                stop = how[1]
+                continue
+            _, enter, leave = how
+            legs.append((trip_ids[self.trip[enter]], stop_ids[self.dep_stop[enter]], int(self.dep_time[enter]),
+                         stop_ids[self.arr_stop[leave]], int(self.arr_time[leave])))
+            stop = int(self.dep_stop[enter])
+        legs.reverse()
+        return legs
+
+class TripPlanner:
+    """
+    Earliest-arrival journeys over the static GTFS, with an optional realtime delay overlay.
+    Timetables are built lazily per service day and reused.
+    """
+
+    def __init__(self, static_dir: str = STATIC_DIR, stops_file: str = STOPS_FILE):
+        self.static_dir = static_dir
+        self.table = stop_times(static_dir)
+        self.stops = cached_table(stops_file, load_stops)
+        self.calendar = service_calendar(static_dir)
+        self.transfers = load_transfers(static_path('transfers.txt', static_dir))
+        self.tz = load_agency_timezone(static_path('agency.txt', static_dir))
+        self._timetables = {}
+        self._delay_engine = None
+
+    def timetable(self, day: Date, trip_delays: dict = None) -> Timetable:
+        if trip_delays:
+            return Timetable(self.table, self.stops, self.calendar, day, self.transfers, self.static_dir, trip_delays)
+        if day not in self._timetables:
+            self._timetables[day] = Timetable(self.table, self.stops, self.calendar, day, self.transfers, self.static_dir)
+        return self._timetables[day]
+
+    def realtime_delays(self, snapshot) -> dict:
+        """
+        Current mean delay of every trip in a FeedSnapshot, for plan(trip_delays=...).
+        Returns: {trip_id: seconds}
+        """
+        if self._delay_engine is None:
+            self._delay_engine = DelayEngine(self.table, self.tz)
+        codes, delays = self._delay_engine.compute_snapshot(snapshot).per_trip()
+        return {self.table.trip_ids[c]: int(round(d)) for c, d in zip(codes, delays)}
+
+    def plan(self, origin: str, destination: str, depart: datetime = None,
+             trip_delays: dict = None) -> typing.Optional[Journey]:
+        """
+        Earliest arrival from origin to destination (stop_name or parent_station code) leaving at `depart`.
+        trip_delays ({trip_id: seconds}, e.g. from delays.DelayResult.per_trip) shifts those trips.
+        Trains after midnight belong to the previous day's timetable (times past 24:00), so that
+        day is scanned too whenever it still has departures after `depart`.
+        """
+        depart = (depart or datetime.now(self.tz)).astimezone(self.tz)
+        epoch = int(depart.timestamp())
+        timetable = self.timetable(depart.date(), trip_delays)
+        best = timetable.earliest_arrival(origin, destination, epoch - timetable.day_start)
+
+        previous = self.timetable(depart.date() - timedelta(days=1), trip_delays)
+        if len(previous.dep_time) and previous.dep_time[-1] >= epoch - previous.day_start:
+            late = previous.earliest_arrival(origin, destination, epoch - previous.day_start)
+            if late is not None and (best is None or late.arrival_epoch < best.arrival_epoch):
+                best = late
+        return best